@@ -1,6 +1,17 @@
+import os
+
 from django.core.files.storage import storages
 from backend.azure_storage import AzureMediaStorage
+from backend.local_blob_storage import LocalBlobStorage
 
 # Replace the default file storage with Azure Media Storage
-storages._storages['default'] = AzureMediaStorage()
+# (MEDIA_STORAGE=local: filesystem blob emulator for offline benchmarks)
+if os.getenv("MEDIA_STORAGE") == "local":
+    storages._storages['default'] = LocalBlobStorage()
+else:
+    storages._storages['default'] = AzureMediaStorage()
+
+# Load the Celery app so @shared_task binds to it (photo derivatives etc.)
+from .celery import app as celery_app
 
+__all__ = ('celery_app',)
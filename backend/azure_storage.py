@@ -1,7 +1,106 @@
 from storages.backends.azure_storage import AzureStorage
 import os
+import threading
+from datetime import datetime, timedelta
 from io import BytesIO
-from azure.storage.blob import BlobServiceClient  # <-- add this import
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotModifiedError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobSasPermissions, BlobServiceClient, ContentSettings, ExponentialRetry, generate_blob_sas
+from django.core.files import File
+from django.core.files.storage import default_storage
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from .blob_cache import get_blob_cache
+from .storage_metrics import instrumented, record_storage_io, storage_io
+
+
+# ----------------------------
+# Shared Azure client (one per process)
+# ----------------------------
+# Every storage call used to build its own BlobServiceClient, so each one
+# paid a new TLS handshake. One client per process keeps connections alive
+# and is safe to share between threads.
+_client_lock = threading.Lock()
+_service_client = None
+_http_adapter = None
+_container_clients = {}
+_client_stats = {"clients_created": 0, "clients_reused": 0}
+
+
+def _client_setting(name, default):
+    from django.conf import settings
+    return getattr(settings, name, default)
+
+
+def _build_service_client():
+    global _http_adapter
+    pool_size = _client_setting("AZURE_POOL_MAXSIZE", 20)
+
+    # keep-alive pool shared by every thread using the client
+    _http_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session = Session()
+    session.mount("https://", _http_adapter)
+    session.mount("http://", _http_adapter)
+
+    account_name = os.getenv("AZURE_ACCOUNT_NAME")
+    return BlobServiceClient(
+        f"https://{account_name}.blob.core.windows.net",
+        credential={"account_name": account_name, "account_key": os.getenv("AZURE_ACCOUNT_KEY")},
+        transport=RequestsTransport(
+            session=session,
+            session_owner=False,
+            connection_timeout=_client_setting("AZURE_CONNECTION_TIMEOUT_SECS", 20),
+        ),
+        retry_policy=ExponentialRetry(
+            retry_total=_client_setting("AZURE_RETRY_TOTAL", 3),
+            initial_backoff=_client_setting("AZURE_RETRY_BACKOFF_SECS", 2),
+            increment_base=3,
+        ),
+        # Blobs over the first GET size are fetched as parallel ranged GETs
+        max_single_get_size=_client_setting("AZURE_DOWNLOAD_THRESHOLD", 4 * 1024 * 1024),
+        max_chunk_get_size=_client_setting("AZURE_DOWNLOAD_CHUNK_SIZE", 4 * 1024 * 1024),
+    )
+
+
+def get_blob_service_client():
+    """Process-wide BlobServiceClient, created on first use."""
+    global _service_client
+    with _client_lock:
+        if _service_client is None:
+            _service_client = _build_service_client()
+            _client_stats["clients_created"] += 1
+        else:
+            _client_stats["clients_reused"] += 1
+        return _service_client
+
+
+def get_container_client(container_name=None):
+    """Shared ContainerClient for the media container (or `container_name`)."""
+    container_name = container_name or os.getenv("AZURE_CONTAINER", "media")
+    client = _container_clients.get(container_name)
+    if client is None:
+        client = get_blob_service_client().get_container_client(container_name)
+        with _client_lock:
+            client = _container_clients.setdefault(container_name, client)
+    return client
+
+
+def blob_client_stats():
+    """
+    Reuse counters for the shared client: how often it was handed out
+    again, and HTTP requests vs connections opened in the keep-alive pool.
+    """
+    with _client_lock:
+        stats = dict(_client_stats)
+        pools = list(_http_adapter.poolmanager.pools._container.values()) if _http_adapter else []
+
+    stats["http_requests"] = sum(pool.num_requests for pool in pools)
+    stats["http_connections"] = sum(pool.num_connections for pool in pools)
+    if stats["http_requests"]:
+        stats["connection_reuse_rate"] = round(1 - stats["http_connections"] / stats["http_requests"], 3)
+    return stats
 
 
 class AzureMediaStorage(AzureStorage):
@@ -10,21 +109,250 @@ class AzureMediaStorage(AzureStorage):
     azure_container = os.getenv("AZURE_CONTAINER", "media")
     expiration_secs = None
 
+    def _get_service_client(self):
+        return get_blob_service_client()
+
+    @property
+    def client(self):
+        return get_container_client(self.azure_container)
+
+    def _download(self, name, **kwargs):
+        blob_client = self.client.get_blob_client(self._get_valid_path(name))
+        return blob_client.download_blob(
+            max_concurrency=_client_setting("AZURE_DOWNLOAD_CONCURRENCY", 4),
+            timeout=self.timeout,
+            **kwargs,
+        )
+
+    def _cached_path(self, cache, name):
+        """
+        Local path of the blob in the read cache, downloading it on a miss.
+        Cached copies are trusted as-is (uploads are never rewritten in place)
+        unless BLOB_CACHE_REVALIDATE is on, which costs a conditional GET.
+        """
+        path, etag = cache.lookup(name)
+        downloader = None
+        if path and _client_setting("BLOB_CACHE_REVALIDATE", False):
+            try:
+                with storage_io("revalidate"):
+                    downloader = self._download(name, etag=f'"{etag}"', match_condition=MatchConditions.IfModified)
+            except ResourceNotModifiedError:
+                pass
+
+        if path and downloader is None:
+            nbytes = os.path.getsize(path)
+            cache.record(hit=True, nbytes=nbytes)
+            record_storage_io("cache_hit", nbytes)
+            return path
+
+        with storage_io("download") as op:
+            downloader = downloader or self._download(name)
+            path = cache.store(name, downloader.properties.etag, downloader.readinto)
+            op.nbytes = downloader.size
+        cache.record(hit=False, nbytes=downloader.size)
+        return path
+
+    def _open(self, name, mode="rb"):
+        cache = get_blob_cache()
+        if cache and mode in ("r", "rb"):
+            return File(open(self._cached_path(cache, name), "rb"), name=name)
+        return super()._open(name, mode)
+
+    def read_bytes(self, name, length=None):
+        """
+        Whole blob in memory, downloaded with concurrent range requests when it
+        is over AZURE_DOWNLOAD_THRESHOLD and kept in the disk read cache. With
+        `length`, only that many bytes from the start (image header / EXIF)
+        are fetched.
+        """
+        cache = get_blob_cache()
+        if length:
+            path, _ = cache.lookup(name) if cache else (None, None)
+            if path:
+                with open(path, "rb") as f:
+                    data = f.read(length)
+                record_storage_io("cache_hit", len(data))
+                return data
+            blob_client = self.client.get_blob_client(self._get_valid_path(name))
+            with storage_io("download_range") as op:
+                data = blob_client.download_blob(offset=0, length=length, timeout=self.timeout).readall()
+                op.nbytes = len(data)
+            return data
+
+        if cache:
+            with open(self._cached_path(cache, name), "rb") as f:
+                return f.read()
+        with storage_io("download") as op:
+            data = self._download(name).readall()
+            op.nbytes = len(data)
+        return data
+
+    def _save(self, name, content):
+        with storage_io("upload", content.size):
+            return super()._save(name, content)
+
+    @instrumented("exists")
+    def exists(self, name):
+        return super().exists(name)
+
+    @instrumented("get_properties")
+    def size(self, name):
+        return super().size(name)
+
+    def upload_url(self, name, expire):
+        """
+        Short-lived SAS URL the app can PUT one blob to directly (create/write
+        on that blob only), so the bytes never pass through a web worker.
+        """
+        blob_client = self.client.get_blob_client(self._get_valid_path(name))
+        sas_token = generate_blob_sas(
+            self.account_name,
+            self.azure_container,
+            blob_client.blob_name,
+            account_key=self.account_key,
+            permission=BlobSasPermissions(create=True, write=True),
+            expiry=datetime.utcnow() + timedelta(seconds=expire),
+        )
+        return f"{blob_client.url}?{sas_token}"
+
+    def copy_blob(self, source, target):
+        """
+        Server-side copy of a blob within the container (Put Blob From URL with
+        a short read SAS on the source). Fails if `target` already exists.
+        """
+        source_client = self.client.get_blob_client(self._get_valid_path(source))
+        sas_token = generate_blob_sas(
+            self.account_name,
+            self.azure_container,
+            source_client.blob_name,
+            account_key=self.account_key,
+            permission=BlobSasPermissions(read=True),
+            expiry=datetime.utcnow() + timedelta(minutes=15),
+        )
+        target_client = self.client.get_blob_client(self._get_valid_path(target))
+        with storage_io("copy"):
+            target_client.upload_blob_from_url(f"{source_client.url}?{sas_token}", overwrite=False, timeout=self.timeout)
+        return target
+
+    def overwrite(self, name, content):
+        """
+        Replace the bytes of an existing blob under the same name (save() never
+        overwrites: it would pick a new, suffixed name).
+        """
+        path = self._get_valid_path(name)
+        params = self._get_content_settings_parameters(path, content)
+        content.seek(0)
+        with storage_io("upload", content.size):
+            self.client.upload_blob(
+                path,
+                content.file if isinstance(content, File) else content,
+                content_settings=ContentSettings(**params),
+                max_concurrency=self.upload_max_conn,
+                timeout=self.timeout,
+                overwrite=True,
+            )
+        cache = get_blob_cache()
+        if cache:
+            cache.discard(name)
+        return name
+
+    def delete(self, name):
+        with storage_io("delete"):
+            super().delete(name)
+        cache = get_blob_cache()
+        if cache:
+            cache.discard(name)
+
+    def delete_many(self, names):
+        """Delete blobs with Azure batch requests (up to 256 per request); missing ones are ignored."""
+        paths = [self._get_valid_path(name) for name in names]
+        for start in range(0, len(paths), 256):
+            with storage_io("delete_batch"):
+                self.client.delete_blobs(*paths[start:start + 256], raise_on_any_failure=False, timeout=self.timeout)
+
+        cache = get_blob_cache()
+        if cache:
+            for name in names:
+                cache.discard(name)
+
+    def set_tier_many(self, names, tier, rehydrate_priority=None):
+        """
+        Move blobs to the 'Hot', 'Cool' or 'Archive' access tier with batch
+        requests (256 per request). Leaving Archive starts a rehydration that
+        takes hours; poll get_tier() for it.
+        """
+        paths = [self._get_valid_path(name) for name in names]
+        for start in range(0, len(paths), 256):
+            with storage_io("set_tier_batch"):
+                self.client.set_standard_blob_tier_blobs(
+                    tier,
+                    *paths[start:start + 256],
+                    rehydrate_priority=rehydrate_priority,
+                    raise_on_any_failure=False,
+                    timeout=self.timeout,
+                )
+
+    def get_tier(self, name):
+        """(tier, archive_status) of a blob, e.g. ('Archive', 'rehydrate-pending-to-hot')."""
+        blob_client = self.client.get_blob_client(self._get_valid_path(name))
+        with storage_io("get_properties"):
+            properties = blob_client.get_blob_properties(timeout=self.timeout)
+        return properties.blob_tier, properties.archive_status
+
+    def iter_blob_pages(self, prefix="", page_size=5000):
+        """Container listing one page at a time, as lists of (name, last_modified)."""
+        blobs = self.client.list_blobs(name_starts_with=prefix, results_per_page=page_size, timeout=self.timeout)
+        pages = blobs.by_page()
+        while True:
+            with storage_io("list"):
+                page = next(pages, None)
+                page = page and [(blob.name, blob.last_modified) for blob in page]
+            if page is None:
+                return
+            yield page
+
+
+def read_storage_bytes(name, length=None, storage=None):
+    """
+    Read a stored file, or its first `length` bytes. Uses the storage's
+    read_bytes() when it has one (ranged/parallel download), else open().
+    """
+    storage = storage or default_storage
+    if hasattr(storage, "read_bytes"):
+        return storage.read_bytes(name, length)
+    with storage.open(name, "rb") as f:
+        return f.read(length) if length else f.read()
+
+
+def overwrite_storage_blob(name, content, storage=None):
+    """Replace a stored file in place, keeping its name. Returns the name."""
+    storage = storage or default_storage
+    if hasattr(storage, "overwrite"):
+        return storage.overwrite(name, content)
+    storage.delete(name)
+    return storage.save(name, content)
+
+
+def delete_storage_blobs(names, storage=None):
+    """Delete many stored files at once (batched where the storage supports it)."""
+    storage = storage or default_storage
+    names = [name for name in names if name]
+    if hasattr(storage, "delete_many"):
+        storage.delete_many(names)
+        return
+    for name in names:
+        storage.delete(name)
+
 
 # ----------------------------
 # Helper function to fetch blob bytes (for PDFs or direct downloads)
 # ----------------------------
 def get_blob_bytes(blob_name: str) -> BytesIO:
-    account_name = os.getenv("AZURE_ACCOUNT_NAME")
-    account_key = os.getenv("AZURE_ACCOUNT_KEY")
-    container_name = os.getenv("AZURE_CONTAINER", "media")
-
-    connection_string = f"DefaultEndpointsProtocol=https;AccountName={account_name};AccountKey={account_key};EndpointSuffix=core.windows.net"
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+    blob_client = get_container_client().get_blob_client(blob_name)
 
     stream = BytesIO()
-    download = blob_client.download_blob()
-    download.readinto(stream)
+    with storage_io("download") as op:
+        download = blob_client.download_blob(max_concurrency=_client_setting("AZURE_DOWNLOAD_CONCURRENCY", 4))
+        op.nbytes = download.readinto(stream)
     stream.seek(0)
     return stream
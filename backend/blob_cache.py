@@ -0,0 +1,163 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+
+
+# ----------------------------
+# On-disk LRU cache for blob reads
+# ----------------------------
+class BlobReadCache:
+    """
+    Read-through disk cache for blob contents, keyed by blob name + etag.
+    Each blob lives at <dir>/<sha[:2]>/<sha of name>/<etag>; the file mtime is
+    the LRU clock (touched on every hit), so gunicorn workers sharing the
+    directory also share the cache. Oldest entries are evicted once the
+    directory grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "hit_bytes": 0, "miss_bytes": 0, "evictions": 0}
+        self._size = None  # bytes on disk, counted on first store
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_dir(self, name):
+        key = hashlib.sha256(name.encode()).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def lookup(self, name):
+        """(path, etag) of the cached copy of `name`, or (None, None)."""
+        entry_dir = self._entry_dir(name)
+        try:
+            etag = os.listdir(entry_dir)[0]
+        except (FileNotFoundError, IndexError):
+            return None, None
+
+        path = os.path.join(entry_dir, etag)
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # evicted by another worker meanwhile
+            return None, None
+        return path, etag
+
+    def store(self, name, etag, write):
+        """
+        Cache a blob: write(fileobj) streams its bytes into a temp file that is
+        then moved into place. Returns the cached path.
+        """
+        entry_dir = self._entry_dir(name)
+        os.makedirs(entry_dir, exist_ok=True)
+        etag = re.sub(r"[^A-Za-z0-9]", "", etag or "") or "noetag"
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            size = os.path.getsize(tmp_path)
+            self.discard(name)
+            path = os.path.join(entry_dir, etag)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self.lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def discard(self, name):
+        entry_dir = self._entry_dir(name)
+        if not os.path.isdir(entry_dir):
+            return
+        for etag in os.listdir(entry_dir):
+            try:
+                os.remove(os.path.join(entry_dir, etag))
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for fname in files:
+                if fname.endswith(".part"):
+                    continue
+                path = os.path.join(root, fname)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _disk_usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Drop least recently used entries until the cache is at 90% of max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+
+        with self.lock:
+            self._size = total
+            self.counters["evictions"] += evicted
+
+    def record(self, hit, nbytes):
+        with self.lock:
+            if hit:
+                self.counters["hits"] += 1
+                self.counters["hit_bytes"] += nbytes
+            else:
+                self.counters["misses"] += 1
+                self.counters["miss_bytes"] += nbytes
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, size_bytes=self._size, max_bytes=self.max_bytes)
+        reads = stats["hits"] + stats["misses"]
+        if reads:
+            stats["hit_rate"] = round(stats["hits"] / reads, 3)
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_blob_cache():
+    """Process-wide BlobReadCache, or None when BLOB_CACHE_MAX_BYTES is 0."""
+    global _cache
+    max_bytes = getattr(settings, "BLOB_CACHE_MAX_BYTES", 0)
+    if not max_bytes:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            directory = getattr(settings, "BLOB_CACHE_DIR", None) or os.path.join(tempfile.gettempdir(), "blob_cache")
+            _cache = BlobReadCache(directory, max_bytes)
+        return _cache
+
+
+def blob_cache_stats():
+    cache = get_blob_cache()
+    return cache.stats() if cache else {}
@@ -1 +1,30 @@
+# backend/celery.py
+import os
+from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
+from .storage_metrics import finish_scope, start_scope
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+app = Celery('backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+# ----------------------------
+# Storage I/O per task run
+# ----------------------------
+_storage_scopes = {}
+
+
+@task_prerun.connect
+def start_storage_io_scope(task_id=None, task=None, **kwargs):
+    _storage_scopes[task_id] = start_scope(f"task {task.name}")
+
+
+@task_postrun.connect
+def finish_storage_io_scope(task_id=None, **kwargs):
+    scope = _storage_scopes.pop(task_id, None)
+    if scope:
+        finish_scope(*scope)
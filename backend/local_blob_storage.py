@@ -0,0 +1,270 @@
+import hashlib
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+from azure.core.exceptions import ResourceNotFoundError
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+from .storage_metrics import instrumented, storage_io
+
+
+# ----------------------------
+# Simulated network cost
+# ----------------------------
+def _simulate_io(nbytes=0):
+    """
+    Sleep like a round trip to Azure: LOCAL_BLOB_LATENCY_MS per operation,
+    plus the transfer time at LOCAL_BLOB_BANDWIDTH_MBPS (0 = unlimited).
+    """
+    latency_ms = getattr(settings, "LOCAL_BLOB_LATENCY_MS", 0)
+    bandwidth_mbps = getattr(settings, "LOCAL_BLOB_BANDWIDTH_MBPS", 0)
+    delay = latency_ms / 1000
+    if bandwidth_mbps and nbytes:
+        delay += nbytes * 8 / (bandwidth_mbps * 1_000_000)
+    if delay:
+        time.sleep(delay)
+
+
+def _etag(path):
+    stat = os.stat(path)
+    return '"0x%X"' % (int(stat.st_mtime_ns) ^ stat.st_size)
+
+
+# ----------------------------
+# Blob API stand-ins (the subset this project calls)
+# ----------------------------
+class _Properties:
+    def __init__(self, size, etag):
+        self.size = size
+        self.etag = etag
+
+
+class _Block:
+    def __init__(self, block_id, size):
+        self.id = block_id
+        self.size = size
+
+
+class LocalBlobDownloader:
+    """Mimics StorageStreamDownloader: readall(), readinto(), size, properties."""
+
+    def __init__(self, path, offset=0, length=None, max_concurrency=1):
+        self.properties = _Properties(os.path.getsize(path), _etag(path))
+        with open(path, "rb") as f:
+            f.seek(offset)
+            self.data = f.read(length) if length else f.read()
+        self.size = len(self.data)
+        # Parallel ranged GETs split the transfer time between connections
+        _simulate_io(self.size // max(max_concurrency, 1))
+
+    def readall(self):
+        return self.data
+
+    def readinto(self, stream):
+        stream.write(self.data)
+        return self.size
+
+
+class LocalBlobClient:
+    """Mimics BlobClient on top of a file under the storage root."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.blob_name = name
+        self.path = storage.path(name)
+        self.staging_dir = os.path.join(storage.location, ".staged", hashlib.sha256(name.encode()).hexdigest())
+
+    def exists(self, **kwargs):
+        _simulate_io()
+        return os.path.exists(self.path)
+
+    def get_blob_properties(self, **kwargs):
+        _simulate_io()
+        return _Properties(os.path.getsize(self.path), _etag(self.path))
+
+    def download_blob(self, offset=0, length=None, max_concurrency=1, **kwargs):
+        return LocalBlobDownloader(self.path, offset, length, max_concurrency)
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        if os.path.exists(self.path) and not overwrite:
+            raise FileExistsError(self.blob_name)
+        data = data if isinstance(data, bytes) else data.read()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(data)
+        _simulate_io(len(data))
+
+    def stage_block(self, block_id, data, length=None, **kwargs):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        with open(os.path.join(self.staging_dir, block_id.replace("/", "_")), "wb") as f:
+            f.write(data)
+        _simulate_io(len(data))
+
+    def get_block_list(self, block_list_type="committed", **kwargs):
+        """(committed, uncommitted) lists of blocks with .id and .size."""
+        _simulate_io()
+        if not os.path.exists(self.path) and not os.path.isdir(self.staging_dir):
+            raise ResourceNotFoundError("The specified blob does not exist.")  # Azure answers 404 too
+        uncommitted = []
+        if os.path.isdir(self.staging_dir):
+            for fname in sorted(os.listdir(self.staging_dir)):
+                uncommitted.append(_Block(fname.replace("_", "/"), os.path.getsize(os.path.join(self.staging_dir, fname))))
+        return [], uncommitted
+
+    def commit_block_list(self, block_list, **kwargs):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "wb") as out:
+            for block in block_list:
+                block_id = getattr(block, "id", block)
+                with open(os.path.join(self.staging_dir, block_id.replace("/", "_")), "rb") as f:
+                    out.write(f.read())
+        for fname in os.listdir(self.staging_dir):
+            os.remove(os.path.join(self.staging_dir, fname))
+        os.rmdir(self.staging_dir)
+        _simulate_io()
+
+    def delete_blob(self, **kwargs):
+        _simulate_io()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.isdir(self.staging_dir):
+            for fname in os.listdir(self.staging_dir):
+                os.remove(os.path.join(self.staging_dir, fname))
+            os.rmdir(self.staging_dir)
+
+
+class LocalContainerClient:
+    """Mimics ContainerClient: get_blob_client() / delete_blob()."""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(self.storage, blob)
+
+    def delete_blob(self, blob, **kwargs):
+        self.get_blob_client(blob).delete_blob()
+
+
+# ----------------------------
+# Storage backend
+# ----------------------------
+class LocalBlobStorage(FileSystemStorage):
+    """
+    Stand-in for AzureMediaStorage that keeps blobs under MEDIA_ROOT but
+    exposes the same client / read_bytes surface (staged block uploads,
+    ranged downloads) and charges LOCAL_BLOB_LATENCY_MS and
+    LOCAL_BLOB_BANDWIDTH_MBPS per operation. Select it with
+    MEDIA_STORAGE=local to benchmark uploads, PDFs and derivatives offline.
+    """
+
+    # BlobStagingUploadHandler can stage blocks against this storage
+    block_staging = True
+
+    @property
+    def client(self):
+        return LocalContainerClient(self)
+
+    def _open(self, name, mode="rb"):
+        if "r" in mode:
+            nbytes = os.path.getsize(self.path(name))
+            with storage_io("download", nbytes):
+                _simulate_io(nbytes)
+        return super()._open(name, mode)
+
+    def _save(self, name, content):
+        with storage_io("upload", content.size):
+            _simulate_io(content.size)
+            return super()._save(name, content)
+
+    def copy_blob(self, source, target):
+        """Server-side copy stand-in; fails if `target` already exists."""
+        target_path = self.path(target)
+        if os.path.exists(target_path):
+            raise FileExistsError(target)
+        with storage_io("copy"):
+            _simulate_io()
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            shutil.copyfile(self.path(source), target_path)
+        return target
+
+    def overwrite(self, name, content):
+        """Replace a blob's bytes in place, keeping its name."""
+        with storage_io("upload", content.size):
+            _simulate_io(content.size)
+            content.seek(0)
+            with open(self.path(name), "wb") as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+        return name
+
+    @instrumented("delete")
+    def delete(self, name):
+        _simulate_io()
+        super().delete(name)
+
+    @instrumented("exists")
+    def exists(self, name):
+        _simulate_io()
+        return super().exists(name)
+
+    def delete_many(self, names):
+        for start in range(0, len(names), 256):
+            with storage_io("delete_batch"):
+                _simulate_io()  # one batch request
+                for name in names[start:start + 256]:
+                    super().delete(name)
+
+    def _tier_path(self, name):
+        return os.path.join(self.location, ".tiers", hashlib.sha256(name.encode()).hexdigest())
+
+    def set_tier_many(self, names, tier, rehydrate_priority=None):
+        """Tier is only recorded; rehydration from Archive completes immediately."""
+        os.makedirs(os.path.join(self.location, ".tiers"), exist_ok=True)
+        for start in range(0, len(names), 256):
+            with storage_io("set_tier_batch"):
+                _simulate_io()
+                for name in names[start:start + 256]:
+                    with open(self._tier_path(name), "w") as f:
+                        f.write(tier)
+
+    @instrumented("get_properties")
+    def get_tier(self, name):
+        _simulate_io()
+        try:
+            with open(self._tier_path(name)) as f:
+                return f.read(), None
+        except FileNotFoundError:
+            return "Hot", None
+
+    def iter_blob_pages(self, prefix="", page_size=5000):
+        page = []
+        for root, dirs, files in os.walk(self.location):
+            dirs[:] = sorted(d for d in dirs if d not in (".staged", ".tiers"))
+            for fname in sorted(files):
+                path = os.path.join(root, fname)
+                name = os.path.relpath(path, self.location).replace(os.sep, "/")
+                if not name.startswith(prefix):
+                    continue
+                page.append((name, datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)))
+                if len(page) == page_size:
+                    with storage_io("list"):
+                        _simulate_io()
+                    yield page
+                    page = []
+        if page:
+            with storage_io("list"):
+                _simulate_io()
+            yield page
+
+    def read_bytes(self, name, length=None):
+        with storage_io("download_range" if length else "download") as op:
+            downloader = self.client.get_blob_client(name).download_blob(
+                length=length,
+                max_concurrency=getattr(settings, "AZURE_DOWNLOAD_CONCURRENCY", 4),
+            )
+            op.nbytes = downloader.size
+        return downloader.readall()
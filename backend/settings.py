@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.storage_metrics.StorageIOMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -117,6 +118,17 @@ DEFAULT_FILE_STORAGE = 'backend.azure_storage.AzureMediaStorage'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = f"https://{AZURE_ACCOUNT_NAME}.blob.core.windows.net/{AZURE_CONTAINER}/"
 
+# MEDIA_STORAGE=local swaps in the filesystem blob emulator
+# (backend.local_blob_storage.LocalBlobStorage, see backend/__init__.py) for
+# offline benchmarks; each blob operation then costs LOCAL_BLOB_LATENCY_MS
+# plus the transfer time at LOCAL_BLOB_BANDWIDTH_MBPS (0 = unlimited).
+MEDIA_STORAGE = os.getenv("MEDIA_STORAGE", "azure")
+if MEDIA_STORAGE == "local":
+    MEDIA_ROOT = os.getenv("LOCAL_BLOB_ROOT", os.path.join(BASE_DIR, "media"))
+    MEDIA_URL = "/media/"
+LOCAL_BLOB_LATENCY_MS = int(os.getenv("LOCAL_BLOB_LATENCY_MS", "0"))
+LOCAL_BLOB_BANDWIDTH_MBPS = float(os.getenv("LOCAL_BLOB_BANDWIDTH_MBPS", "0"))
+
 
 # ----------------------------
 # CORS
@@ -164,12 +176,130 @@ REDIS_USERNAME = "default"
 
 CELERY_BROKER_URL = f"rediss://{REDIS_USERNAME}:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/0"
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
+# rediss:// needs explicit TLS settings (Azure Cache for Redis)
+CELERY_BROKER_USE_SSL = {"ssl_cert_reqs": ssl.CERT_REQUIRED}
+CELERY_REDIS_BACKEND_USE_SSL = CELERY_BROKER_USE_SSL
 
 CELERY_TIMEZONE = "America/Toronto"
 CELERY_ENABLE_UTC = False
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 
+# ----------------------------
+# Azure storage client
+# ----------------------------
+# One BlobServiceClient per process (backend.azure_storage.get_blob_service_client)
+AZURE_POOL_MAXSIZE = int(os.getenv("AZURE_POOL_MAXSIZE", "20"))  # keep-alive connections per process
+AZURE_RETRY_TOTAL = int(os.getenv("AZURE_RETRY_TOTAL", "3"))
+AZURE_RETRY_BACKOFF_SECS = int(os.getenv("AZURE_RETRY_BACKOFF_SECS", "2"))
+# Blobs larger than the threshold are downloaded as parallel range requests
+AZURE_DOWNLOAD_THRESHOLD = int(os.getenv("AZURE_DOWNLOAD_THRESHOLD", str(4 * 1024 * 1024)))
+AZURE_DOWNLOAD_CHUNK_SIZE = int(os.getenv("AZURE_DOWNLOAD_CHUNK_SIZE", str(4 * 1024 * 1024)))
+AZURE_DOWNLOAD_CONCURRENCY = int(os.getenv("AZURE_DOWNLOAD_CONCURRENCY", "4"))
+
+# Local disk cache for blob reads (PDF builds, derivatives); 0 turns it off.
+# Keyed by blob name + etag, least recently used entries evicted past the cap.
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR") or None  # default: <tmp>/blob_cache
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+BLOB_CACHE_REVALIDATE = os.getenv("BLOB_CACHE_REVALIDATE", "False") == "True"
+
+# Storage I/O (op counts, bytes, latency) is recorded per request and per Celery
+# task; see backend.storage_metrics and /admin/storage-io/ for the aggregates.
+STORAGE_IO_HEADERS = os.getenv("STORAGE_IO_HEADERS", str(DEBUG)) == "True"  # X-Storage-* response headers
+STORAGE_IO_SLOW_MS = int(os.getenv("STORAGE_IO_SLOW_MS", "2000"))  # log a warning past this much storage time
+
+# ----------------------------
+# Photo derivatives
+# ----------------------------
+# Resized photos are built by the Celery worker after upload. Set
+# PHOTO_DERIVATIVES_EAGER=True to build them inline instead (tests, local runs without Redis).
+PHOTO_DERIVATIVES_EAGER = os.getenv("PHOTO_DERIVATIVES_EAGER", "False") == "True"
+# Failed builds (corrupt / undecodable files) are retried by the backfill this many times
+DERIVATIVE_MAX_ATTEMPTS = int(os.getenv("DERIVATIVE_MAX_ATTEMPTS", "5"))
+# The backfill leaves 'pending' uploads younger than this to their queued job
+DERIVATIVE_BACKFILL_GRACE_MINUTES = int(os.getenv("DERIVATIVE_BACKFILL_GRACE_MINUTES", "30"))
+
+# Processes in the shared image pool (resize/encode for PDFs and derivative backfill).
+# Defaults to one per core; 1 runs everything inline in the calling process.
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", "0")) or os.cpu_count()
+
+# Parallel blob uploads per bulk photo ingest request
+BULK_UPLOAD_WORKERS = int(os.getenv("BULK_UPLOAD_WORKERS", "8"))
+
+# Photos fetched (and handed to the image pool) at once while a load PDF is drawn
+PDF_FETCH_WORKERS = int(os.getenv("PDF_FETCH_WORKERS", "8"))
+# Generated PDFs are written to a spooled file that moves to disk past this size
+PDF_SPOOL_MAX_BYTES = int(os.getenv("PDF_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Lifetime of the signed URLs handed out for direct-to-blob uploads
+DIRECT_UPLOAD_EXPIRATION_SECS = int(os.getenv("DIRECT_UPLOAD_EXPIRATION_SECS", "900"))
+
+# Resumable uploads: chunk size sent by the app, and how long an unfinished
+# session may sit idle before cleanup_resumable_uploads drops it
+RESUMABLE_CHUNK_SIZE = int(os.getenv("RESUMABLE_CHUNK_SIZE", str(1024 * 1024)))
+RESUMABLE_UPLOAD_TTL_HOURS = int(os.getenv("RESUMABLE_UPLOAD_TTL_HOURS", "24"))
+
+# Orphan blob sweep: only blobs older than this are candidates (must stay above
+# the resumable/direct upload lifetimes), listed this many per page
+ORPHAN_SWEEP_MIN_AGE_HOURS = int(os.getenv("ORPHAN_SWEEP_MIN_AGE_HOURS", "48"))
+ORPHAN_SWEEP_PAGE_SIZE = int(os.getenv("ORPHAN_SWEEP_PAGE_SIZE", "5000"))
+
+# Storage tiering of originals for delivered loads (renditions stay hot).
+# Days after delivery before Cool / Archive; 0 turns a step off.
+ORIGINAL_COOL_AFTER_DAYS = int(os.getenv("ORIGINAL_COOL_AFTER_DAYS", "30"))
+ORIGINAL_ARCHIVE_AFTER_DAYS = int(os.getenv("ORIGINAL_ARCHIVE_AFTER_DAYS", "180"))
+ORIGINAL_REHYDRATE_PRIORITY = os.getenv("ORIGINAL_REHYDRATE_PRIORITY", "Standard")  # or "High"
+
+# Upload budgets per photo type, checked from the image header before anything
+# is decoded. Over max_bytes / max_pixels the upload is rejected (413); over
+# defer_pixels (or animated past max_frames) the photo is stored but its
+# derivatives are left to the periodic backfill instead of the upload queue.
+PHOTO_UPLOAD_LIMITS = {
+    "default": {
+        "max_bytes": 20 * 1024 * 1024,
+        "max_pixels": 50_000_000,
+        "defer_pixels": 24_000_000,
+        "max_frames": 2,
+    },
+    # Scanned documents can be larger than phone photos
+    "bol": {
+        "max_bytes": 30 * 1024 * 1024,
+        "max_pixels": 100_000_000,
+        "defer_pixels": 40_000_000,
+        "max_frames": 2,
+    },
+    "POD": {
+        "max_bytes": 30 * 1024 * 1024,
+        "max_pixels": 100_000_000,
+        "defer_pixels": 40_000_000,
+        "max_frames": 2,
+    },
+}
+
+# Deferred / failed derivatives are picked up by the beat scheduler (worker runs with -B)
+CELERY_BEAT_SCHEDULE = {
+    'backfill-photo-derivatives': {
+        'task': 'driver.tasks.backfill_photo_derivatives',
+        'schedule': 15 * 60,
+    },
+    'cleanup-resumable-uploads': {
+        'task': 'driver.tasks.cleanup_resumable_uploads',
+        'schedule': 60 * 60,
+    },
+    'sweep-orphan-blobs': {
+        'task': 'driver.tasks.sweep_orphan_blobs',
+        'schedule': 24 * 60 * 60,
+    },
+    'tier-delivered-originals': {
+        'task': 'driver.tasks.tier_delivered_originals',
+        'schedule': 24 * 60 * 60,
+    },
+    'check-rehydrations': {
+        'task': 'driver.tasks.check_rehydrations',
+        'schedule': 60 * 60,
+    },
+}
+
 # ----------------------------
 # Logging Configuration
 # ----------------------------
@@ -206,6 +336,11 @@ LOGGING = {
             "level": "ERROR",
             "propagate": True,
         },
+        "storage_io": {
+            "handlers": ["console"],
+            "level": os.getenv("STORAGE_IO_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
     },
 }
 
@@ -0,0 +1,216 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger("storage_io")
+
+
+# ----------------------------
+# Storage I/O of one request / background job
+# ----------------------------
+class StorageIOStats:
+    """Storage operations recorded under one scope: {op: [count, bytes, seconds]}."""
+
+    def __init__(self, label):
+        self.label = label
+        self.ops = {}
+        self.lock = threading.Lock()
+
+    def add(self, op, nbytes=0, seconds=0.0, count=1):
+        with self.lock:
+            totals = self.ops.setdefault(op, [0, 0, 0.0])
+            totals[0] += count
+            totals[1] += nbytes
+            totals[2] += seconds
+
+    def merge(self, other):
+        for op, (count, nbytes, seconds) in other.snapshot().items():
+            self.add(op, nbytes, seconds, count)
+
+    def snapshot(self):
+        with self.lock:
+            return {op: list(totals) for op, totals in self.ops.items()}
+
+    def totals(self):
+        """(operations, bytes, seconds) over every op."""
+        ops = self.snapshot().values()
+        return sum(t[0] for t in ops), sum(t[1] for t in ops), sum(t[2] for t in ops)
+
+
+class _Op:
+    """Handed out by storage_io(); set .nbytes once the size is known."""
+
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+_current = contextvars.ContextVar("storage_io_stats", default=None)
+
+
+@contextmanager
+def storage_io(op, nbytes=0):
+    """
+    Time one storage operation and add it to the current scope (no-op cost
+    beyond two clock reads when nothing is being recorded). Failed operations
+    are recorded too.
+    """
+    record = _Op(nbytes)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        stats = _current.get()
+        if stats is not None:
+            stats.add(op, record.nbytes, time.perf_counter() - start)
+
+
+def instrumented(op):
+    """Decorator form of storage_io() for storage methods that move no payload."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with storage_io(op):
+                return method(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_storage_io(op, nbytes=0, seconds=0.0):
+    """Record an operation that was not timed with storage_io() (e.g. a cache hit)."""
+    stats = _current.get()
+    if stats is not None:
+        stats.add(op, nbytes, seconds)
+
+
+def bind_storage_io(fn):
+    """
+    Wrap fn so storage calls it makes on a pool thread count towards the
+    caller's request/job (context variables do not follow pool.submit()).
+    """
+    stats = _current.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(stats)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+# ----------------------------
+# Scopes and process-wide aggregates
+# ----------------------------
+_aggregate_lock = threading.Lock()
+_aggregate = {}  # label -> {"calls": n, "ops": {op: [count, bytes, seconds]}}
+
+
+def start_scope(label):
+    """Start recording; returns (stats, token) for finish_scope()."""
+    stats = StorageIOStats(label)
+    return stats, _current.set(stats)
+
+
+def finish_scope(stats, token, label=None):
+    """
+    Stop recording, fold the scope into the per-label aggregate (and into the
+    enclosing scope, e.g. a task run eagerly inside a request) and log it.
+    """
+    _current.reset(token)
+    stats.label = label or stats.label
+    parent = _current.get()
+    if parent is not None:
+        parent.merge(stats)
+
+    ops = stats.snapshot()
+    with _aggregate_lock:
+        entry = _aggregate.setdefault(stats.label, {"calls": 0, "ops": {}})
+        entry["calls"] += 1
+        for op, (count, nbytes, seconds) in ops.items():
+            totals = entry["ops"].setdefault(op, [0, 0, 0.0])
+            totals[0] += count
+            totals[1] += nbytes
+            totals[2] += seconds
+
+    if ops:
+        count, nbytes, seconds = stats.totals()
+        level = logging.WARNING if seconds * 1000 >= getattr(settings, "STORAGE_IO_SLOW_MS", 2000) else logging.INFO
+        logger.log(level, "storage_io %s ops=%d bytes=%d ms=%.1f %s", stats.label, count, nbytes, seconds * 1000,
+                   " ".join(f"{op}={c}" for op, (c, _, _) in sorted(ops.items())))
+    return stats
+
+
+@contextmanager
+def storage_io_scope(label):
+    stats, token = start_scope(label)
+    try:
+        yield stats
+    finally:
+        finish_scope(stats, token)
+
+
+def storage_io_metrics(reset=False):
+    """
+    Aggregated storage I/O per endpoint / task since the process started,
+    heaviest (by storage time) first.
+    """
+    with _aggregate_lock:
+        entries = {label: {"calls": e["calls"], "ops": {op: list(t) for op, t in e["ops"].items()}}
+                   for label, e in _aggregate.items()}
+        if reset:
+            _aggregate.clear()
+
+    rows = []
+    for label, entry in entries.items():
+        ops = entry["ops"]
+        count = sum(t[0] for t in ops.values())
+        nbytes = sum(t[1] for t in ops.values())
+        seconds = sum(t[2] for t in ops.values())
+        rows.append({
+            "label": label,
+            "calls": entry["calls"],
+            "ops": count,
+            "bytes": nbytes,
+            "ms": round(seconds * 1000, 1),
+            "ms_per_call": round(seconds * 1000 / entry["calls"], 1),
+            "by_op": {op: {"count": c, "bytes": b, "ms": round(s * 1000, 1)} for op, (c, b, s) in sorted(ops.items())},
+        })
+    rows.sort(key=lambda row: row["ms"], reverse=True)
+    return rows
+
+
+# ----------------------------
+# Request middleware
+# ----------------------------
+class StorageIOMiddleware:
+    """
+    Records the storage I/O of each request under "<METHOD> <url name>".
+    With STORAGE_IO_HEADERS (DEBUG by default) the totals are returned as
+    X-Storage-Ops / X-Storage-Bytes / X-Storage-Ms and a Server-Timing entry.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats, token = start_scope(request.method)
+        try:
+            response = self.get_response(request)
+        finally:
+            match = getattr(request, "resolver_match", None)
+            view_name = (match.view_name or match._func_path) if match else "unresolved"
+            finish_scope(stats, token, f"{request.method} {view_name}")
+
+        if getattr(settings, "STORAGE_IO_HEADERS", settings.DEBUG):
+            count, nbytes, seconds = stats.totals()
+            response["X-Storage-Ops"] = str(count)
+            response["X-Storage-Bytes"] = str(nbytes)
+            response["X-Storage-Ms"] = f"{seconds * 1000:.1f}"
+            response["Server-Timing"] = f'storage;dur={seconds * 1000:.1f};desc="{count} ops"'
+        return response
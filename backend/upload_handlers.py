@@ -0,0 +1,163 @@
+import base64
+import hashlib
+import os
+import uuid
+
+from azure.storage.blob import BlobBlock, ContentSettings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from rest_framework.parsers import MultiPartParser
+from storages.backends.azure_storage import AzureStorage
+
+from .storage_metrics import storage_io
+
+
+# Azure block size for staged uploads (phones send 2-8 MB photos, so 1-2 blocks each)
+STAGED_BLOCK_SIZE = 4 * 1024 * 1024
+STAGED_UPLOAD_DIR = "driver_uploads/incoming"
+# Bytes kept from the start of each file so the view can inspect the image header
+HEADER_PREFIX_BYTES = 256 * 1024
+
+
+def supports_block_staging(storage):
+    return isinstance(storage, AzureStorage) or getattr(storage, "block_staging", False)
+
+
+def make_block_id(index):
+    return base64.b64encode(f"{index:08d}".encode()).decode()
+
+
+# ----------------------------
+# Uploaded file that only exists as staged Azure blocks
+# ----------------------------
+class StagedBlobUpload(UploadedFile):
+    """
+    What the view gets instead of an in-memory/temp file: a blob with its
+    blocks staged but not committed, plus the size and SHA-256 computed while
+    the body streamed in. Call commit() to make the blob visible; blocks that
+    are never committed are discarded by Azure after 7 days.
+    Only the first HEADER_PREFIX_BYTES are kept locally (header_prefix), so
+    this object cannot be read.
+    """
+
+    def __init__(self, blob_client, blob_name, block_ids, name, content_type, size, charset, content_digest, header_prefix=b"", storage=None):
+        super().__init__(None, name, content_type, size, charset)
+        self.storage = storage or default_storage
+        self.blob_client = blob_client
+        self.blob_name = blob_name
+        self.block_ids = block_ids
+        self.content_digest = content_digest
+        self.header_prefix = header_prefix
+
+    def commit(self, name=None):
+        """
+        Commit the staged block list; returns the blob name to store on the
+        model. Blocks are staged before the view knows the load, so with
+        `name` the committed blob is then moved there by a server-side copy
+        (the bytes do not pass through this worker again).
+        """
+        with storage_io("commit_blocks"):
+            self.blob_client.commit_block_list(
+                [BlobBlock(block_id=block_id) for block_id in self.block_ids],
+                content_settings=ContentSettings(content_type=self.content_type),
+            )
+        if name and name != self.blob_name:
+            self.storage.copy_blob(self.blob_name, name)
+            self.storage.delete(self.blob_name)
+            self.blob_name = name
+        return self.blob_name
+
+    def chunks(self, chunk_size=None):
+        raise ValueError("Staged uploads are not kept locally; use content_digest / commit()")
+
+    def read(self, *args, **kwargs):
+        raise ValueError("Staged uploads are not kept locally; use content_digest / commit()")
+
+
+# ----------------------------
+# Upload handler: multipart chunks -> Azure staged blocks
+# ----------------------------
+class BlobStagingUploadHandler(FileUploadHandler):
+    """
+    Streams each uploaded file straight to Azure as block-blob blocks while the
+    multipart body is parsed, hashing and counting bytes on the way. Nothing is
+    buffered beyond one block and nothing touches local disk.
+    Passes files through to the next handler when storage is not Azure.
+    """
+
+    def __init__(self, request=None, storage=None):
+        super().__init__(request)
+        self.storage = storage or default_storage
+        self.activated = supports_block_staging(self.storage)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if not self.activated:
+            return
+
+        ext = os.path.splitext(file_name)[1].lower()
+        self.blob_name = f"{STAGED_UPLOAD_DIR}/{uuid.uuid4().hex}{ext}"
+        self.blob_client = self.storage.client.get_blob_client(self.blob_name)
+        self.block_ids = []
+        self.buffer = bytearray()
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.header_prefix = bytearray()
+        raise StopFutureHandlers()
+
+    def _stage_block(self):
+        block_id = make_block_id(len(self.block_ids))
+        with storage_io("stage_block", len(self.buffer)):
+            self.blob_client.stage_block(block_id, bytes(self.buffer), length=len(self.buffer))
+        self.block_ids.append(block_id)
+        self.buffer = bytearray()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.activated:
+            return raw_data
+
+        self.digest.update(raw_data)
+        self.size += len(raw_data)
+        if len(self.header_prefix) < HEADER_PREFIX_BYTES:
+            self.header_prefix += raw_data[:HEADER_PREFIX_BYTES - len(self.header_prefix)]
+        self.buffer += raw_data
+        if len(self.buffer) >= STAGED_BLOCK_SIZE:
+            self._stage_block()
+        return None
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+
+        if self.buffer:
+            self._stage_block()
+        return StagedBlobUpload(
+            blob_client=self.blob_client,
+            blob_name=self.blob_name,
+            block_ids=self.block_ids,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.size,
+            charset=self.charset,
+            content_digest=self.digest.hexdigest(),
+            header_prefix=bytes(self.header_prefix),
+            storage=self.storage,
+        )
+
+
+# ----------------------------
+# DRF parser for the photo upload views
+# ----------------------------
+class BlobStagingMultiPartParser(MultiPartParser):
+    """
+    MultiPartParser that puts BlobStagingUploadHandler in front of Django's
+    default handlers. Used per view (not FILE_UPLOAD_HANDLERS) so admin
+    imports and other uploads keep the normal behaviour.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        django_request = request._request
+        django_request.upload_handlers = [BlobStagingUploadHandler(django_request)] + list(django_request.upload_handlers)
+        return super().parse(stream, media_type, parser_context)
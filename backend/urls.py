@@ -2,9 +2,26 @@ from django.urls import path, include
 from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
-from django.http import HttpResponse  # <-- add this
+from django.http import HttpResponse, JsonResponse  # <-- add this
+from django.contrib.admin.views.decorators import staff_member_required
+
+from backend.azure_storage import blob_client_stats
+from backend.blob_cache import blob_cache_stats
+from backend.storage_metrics import storage_io_metrics
+
+
+@staff_member_required
+def storage_io_view(request):
+    """Storage I/O per endpoint / task in this process, heaviest first (?reset=1 clears it)."""
+    return JsonResponse({
+        "endpoints": storage_io_metrics(reset=request.GET.get("reset") == "1"),
+        "blob_cache": blob_cache_stats(),
+        "blob_client": blob_client_stats(),
+    })
+
 
 urlpatterns = [
+    path('admin/storage-io/', storage_io_view),
     path('admin/', admin.site.urls),
 
     # All driver-related API routes
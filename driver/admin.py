@@ -9,24 +9,24 @@ from .resources import (
     CompanyResource, CustomerResource,
     DriverLoadInfoResource
 )
+from .images import prefetch_images, prepare_pdf_image
 import io
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import Table, TableStyle, Image, Paragraph
 from reportlab.lib import colors
 from django.urls import path, reverse
-from django.http import HttpResponse
+from django.http import FileResponse
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import cm
 
 import pytz
 from django.utils import timezone
 
-from PIL import Image as PILImage
 import os
-import tempfile
 from reportlab.platypus import Image as RLImage
-from django.core.files.storage import default_storage
+from backend.azure_storage import read_storage_bytes
+from .utils import cached_load_pdf, pdf_spool
 
 # -----------------------------
 # Company & Customer Admin
@@ -78,7 +78,8 @@ class DriverLoadPhotoInline(admin.TabularInline):
     show_change_link = False
 
     def preview(self, obj):
-        img_url = obj.resized_image.url if obj.resized_image else obj.image.url if obj.image else None
+        preview_file = obj.best_rendition(50, 50)
+        img_url = preview_file.url if preview_file else None
         if img_url:
             return format_html('<img src="{}" width="50" height="50" />', img_url)
         return "-"
@@ -156,31 +157,33 @@ class DriverLoadInfoAdmin(ImportExportModelAdmin):
         return custom_urls + urls
 
     # -----------------------------
-    # Helper to load image directly from Azure via default_storage
+    # Helper to load image bytes directly from Azure via default_storage
     # -----------------------------
-    def get_pil_image_from_storage(self, photo_file):
+    def get_image_bytes_from_storage(self, photo_file):
         try:
             if not photo_file:
-                return None, None
-
-            # Read file bytes from Azure storage
-            file_bytes = default_storage.open(photo_file.name, 'rb')
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-                tmp.write(file_bytes.read())
-                tmp.flush()
-                pil_img = PILImage.open(tmp.name)
-                pil_img.load()
-                return pil_img, tmp.name
+                return None
+
+            # Read file bytes from Azure storage (ranged parallel GETs for large blobs)
+            return read_storage_bytes(photo_file.name)
         except Exception as e:
             print(f"⚠️ Error loading image {photo_file.name} from storage: {e}")
-            return None, None
+            return None
 
     # -----------------------------
     # PDF Generation
     # -----------------------------
     def download_load_pdf(self, request, load_id):
+        # Also the target of the download link in pickup / delivery emails,
+        # so repeat clicks are served from the cached copy
         load = self.get_object(request, load_id)
-        buffer = io.BytesIO()
+        photos = list(DriverLoadPhoto.objects.filter(load=load))
+        pdf = cached_load_pdf(load, photos, lambda: self.render_load_pdf(load, photos))
+        return FileResponse(pdf, content_type='application/pdf')
+
+    def render_load_pdf(self, load, photos):
+        """Draw the load report; returns (buffer, every photo page had its image)."""
+        buffer = pdf_spool()
         p = canvas.Canvas(buffer, pagesize=A4)
         width, height = A4
         page_num = 1
@@ -340,9 +343,20 @@ class DriverLoadInfoAdmin(ImportExportModelAdmin):
         # -----------------------------
         # Images
         # -----------------------------
-        photos = DriverLoadPhoto.objects.filter(load=load)
+        # Page images are fetched and resized + encoded concurrently (storage
+        # threads feeding the shared image pool); pages are drawn in order as
+        # each one becomes ready
+        max_width = width - 120
+        max_height = height - 220
+        photo_files = [photo.best_rendition(max_width, max_height) for photo in photos]
+        page_images = prefetch_images(
+            prepare_pdf_image, self.get_image_bytes_from_storage, photo_files, ((max_width, max_height), 75)
+        )
+        complete = True
 
-        for photo in photos:
+        for photo, photo_file, page_image in zip(photos, photo_files, page_images):
+            if not page_image:
+                complete = False
         
             # =========================================================
             # 🎨 SAME PREMIUM HEADER (consistency)
@@ -384,21 +398,16 @@ class DriverLoadInfoAdmin(ImportExportModelAdmin):
             # =========================================================
             # 🖼 IMAGE (VERTICALLY CENTERED — premium look)
             # =========================================================
-            photo_file = photo.resized_image if photo.resized_image else photo.image
-        
             if photo_file:
                 try:
-                    pil_img, tmp_path = self.get_pil_image_from_storage(photo_file)
-        
-                    if pil_img:
-                        pil_img = pil_img.convert('RGB')
-        
-                        max_width = width - 120
-                        max_height = height - 220
-                        pil_img.thumbnail((max_width, max_height), PILImage.LANCZOS)
-                        pil_img.save(tmp_path)
-        
-                        rl_img = RLImage(tmp_path)
+                    if page_image:
+                        img_bytes, (img_width, img_height) = page_image
+
+                        # Passed-through renditions can be larger than the box: scale them down to fit
+                        scale = min(1, max_width / img_width, max_height / img_height)
+
+                        # Encoded JPEG handed to ReportLab in memory (no temp file to write, reopen or leak)
+                        rl_img = RLImage(io.BytesIO(img_bytes), width=img_width * scale, height=img_height * scale)
                         rl_img.wrapOn(p, width, height)
         
                         # 🔥 TRUE VERTICAL CENTERING
@@ -421,12 +430,11 @@ class DriverLoadInfoAdmin(ImportExportModelAdmin):
                             image_y
                         )
         
-                        os.unlink(tmp_path)
-        
                     else:
                         p.drawString(50, height - 100, f"Cannot load image {safe_str(photo_file.name)}")
         
                 except Exception as e:
+                    complete = False
                     p.drawString(50, height - 100, f"Cannot load image {safe_str(photo_file.name)}: {e}")
         
             # footer
@@ -439,7 +447,7 @@ class DriverLoadInfoAdmin(ImportExportModelAdmin):
         # -----------------------------
         p.save()
         buffer.seek(0)
-        return HttpResponse(buffer, content_type='application/pdf')
+        return buffer, complete
 
     # -----------------------------
     # Permissions
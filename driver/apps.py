@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DriverConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'driver'
+
+    def ready(self):
+        from . import signals  # connects the blob cleanup handlers
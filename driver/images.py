@@ -0,0 +1,501 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from decimal import Decimal
+from PIL import Image, ImageOps, features
+
+from backend.storage_metrics import bind_storage_io
+
+
+# -------------------------------
+# Pre-decode inspection (pixel / byte budget)
+# -------------------------------
+class PhotoRejected(ValueError):
+    """Upload refused before decoding; status is the HTTP code to answer with."""
+
+    def __init__(self, message, status=413):
+        super().__init__(message)
+        self.status = status
+
+
+def inspect_image_header(fileobj):
+    """
+    Read only the image header: format, dimensions and frame count.
+    Nothing is decoded. Raises PhotoRejected if it is not a readable image.
+    """
+    try:
+        img = Image.open(fileobj)
+        try:
+            frames = getattr(img, 'n_frames', 1)
+        except Exception:
+            frames = 1
+        header = {
+            'format': img.format,
+            'width': img.width,
+            'height': img.height,
+            'pixels': img.width * img.height,
+            'frames': frames,
+        }
+        # No img.close(): Pillow would close the caller's file object too
+        return header
+    except Image.DecompressionBombError as e:
+        raise PhotoRejected(str(e))
+    except Exception:
+        raise PhotoRejected("File is not a readable image", status=400)
+
+
+def photo_upload_limits(photo_type):
+    from django.conf import settings
+    limits = getattr(settings, 'PHOTO_UPLOAD_LIMITS', {})
+    return limits.get(photo_type) or limits.get('default', {})
+
+
+def check_photo_budget(header, size, photo_type):
+    """
+    Apply the per-type PHOTO_UPLOAD_LIMITS to an inspected upload.
+    Returns 'ok' or 'defer' (too big to process right away), raises
+    PhotoRejected when the file is over the hard byte/pixel limits.
+    """
+    limits = photo_upload_limits(photo_type)
+
+    if limits.get('max_bytes') and size > limits['max_bytes']:
+        raise PhotoRejected(f"File is {size} bytes, limit for {photo_type} is {limits['max_bytes']}")
+    if limits.get('max_pixels') and header['pixels'] > limits['max_pixels']:
+        raise PhotoRejected(
+            f"Image is {header['width']}x{header['height']}, limit for {photo_type} is {limits['max_pixels']} pixels"
+        )
+
+    if limits.get('defer_pixels') and header['pixels'] > limits['defer_pixels']:
+        return 'defer'
+    if limits.get('max_frames') and header['frames'] > limits['max_frames']:
+        return 'defer'
+    return 'ok'
+
+
+# -------------------------------
+# Decode-time downscaling
+# -------------------------------
+def decode_scale(src_size, max_size):
+    """
+    Pick the cheapest power-of-two decode scale (1, 2, 4 or 8) for fitting an
+    image of src_size into a max_size box: the largest one that still leaves
+    the decoded image at least as big as the final thumbnail.
+    """
+    src_width, src_height = src_size
+    max_width, max_height = max_size
+    ratio = min(max_width / src_width, max_height / src_height)
+    if ratio >= 1:
+        return 1
+
+    target_width, target_height = src_width * ratio, src_height * ratio
+    scale = 1
+    while scale < 8 and src_width / (scale * 2) >= target_width and src_height / (scale * 2) >= target_height:
+        scale *= 2
+    return scale
+
+
+def open_downscaled(fileobj, max_width, max_height):
+    """
+    Open an image that is about to be thumbnailed to (max_width, max_height).
+    JPEGs are decoded at a reduced DCT scale (Image.draft), so a 12MP phone photo
+    never gets fully decoded for an 800px target; other formats are box-reduced
+    right after decode. The caller still calls thumbnail() for the exact size.
+    """
+    img = Image.open(fileobj)
+    scale = decode_scale(img.size, (max_width, max_height))
+    if scale == 1:
+        return img
+
+    if img.format == 'JPEG':
+        img.draft(img.mode, (img.width // scale, img.height // scale))
+        return img
+
+    reduced = img.reduce(scale)
+    img.close()
+    return reduced
+
+
+# -------------------------------
+# Ingest normalization (orientation + metadata)
+# -------------------------------
+EXIF_ORIENTATION = 0x0112
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+EXIF_DATETIME_ORIGINAL = 36867
+
+# JPEG segments kept when stripping: APP0 (JFIF), APP2 (ICC profile only), APP14 (Adobe colour transform)
+JPEG_KEEP_MARKERS = {0xE0, 0xE2, 0xEE}
+
+
+def strip_jpeg_metadata(data):
+    """
+    Drop EXIF/XMP (APP1), IPTC (APP13), comments and the other APPn segments
+    from a JPEG without decoding it. Scan data is copied byte for byte.
+    Returns the input unchanged if it does not parse as a JPEG.
+    """
+    if data[:2] != b'\xff\xd8':
+        return data
+
+    out = bytearray(data[:2])
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return data
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0xDA:  # start of scan: rest of the file is image data
+            out += data[i:]
+            return bytes(out)
+
+        length = int.from_bytes(data[i + 2:i + 4], 'big')
+        segment = data[i:i + 2 + length]
+        is_app_or_comment = 0xE0 <= marker <= 0xEF or marker == 0xFE
+        keep = not is_app_or_comment or marker in JPEG_KEEP_MARKERS
+        if marker == 0xE2 and not segment[4:16] == b'ICC_PROFILE\x00':
+            keep = False
+        if keep:
+            out += segment
+        i += 2 + length
+    return data
+
+
+def _gps_degrees(values, ref):
+    degrees, minutes, seconds = (float(v) for v in values)
+    value = degrees + minutes / 60 + seconds / 3600
+    if ref in ('S', 'W'):
+        value = -value
+    return Decimal(str(round(value, 6)))
+
+
+def read_photo_metadata(exif):
+    """
+    Pull the bits of EXIF we keep in DB columns: capture time (naive, as the
+    phone recorded it) and GPS position. Missing or garbled tags give None,
+    and so do positions outside +-90 / +-180 degrees.
+    """
+    metadata = {'captured_at': None, 'gps_latitude': None, 'gps_longitude': None}
+
+    try:
+        taken = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(0x0132)
+        if taken:
+            metadata['captured_at'] = datetime.strptime(str(taken).strip('\x00 '), '%Y:%m:%d %H:%M:%S')
+    except (ValueError, TypeError):
+        pass
+
+    try:
+        gps = exif.get_ifd(GPS_IFD)
+        if gps.get(2) and gps.get(4):
+            latitude = _gps_degrees(gps[2], gps.get(1))
+            longitude = _gps_degrees(gps[4], gps.get(3))
+            if abs(latitude) <= 90 and abs(longitude) <= 180:
+                metadata['gps_latitude'] = latitude
+                metadata['gps_longitude'] = longitude
+    except (ValueError, TypeError, ZeroDivisionError):
+        pass
+
+    return metadata
+
+
+def normalize_photo(data):
+    """
+    Ingest stage for an uploaded photo. Returns (normalized bytes, metadata):
+      - orientation tag applied once, so no consumer has to rotate again
+      - EXIF/XMP/embedded thumbnails stripped (losslessly when no rotation is needed)
+      - capture time and GPS returned for DB columns
+    """
+    img = Image.open(io.BytesIO(data))
+    exif = img.getexif()
+    metadata = read_photo_metadata(exif)
+    orientation = exif.get(EXIF_ORIENTATION, 1)
+
+    if orientation not in (1, None):
+        fmt = img.format or 'JPEG'
+        icc_profile = img.info.get('icc_profile')
+        img = ImageOps.exif_transpose(img)
+        if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        img_io = io.BytesIO()
+        save_kwargs = {'quality': 95} if fmt == 'JPEG' else {}
+        if icc_profile:
+            save_kwargs['icc_profile'] = icc_profile
+        img.save(img_io, format=fmt, **save_kwargs)
+        img.close()
+        return img_io.getvalue(), metadata
+
+    fmt = img.format
+    img.close()
+    if fmt == 'JPEG':
+        return strip_jpeg_metadata(data), metadata
+    return data, metadata
+
+
+# -------------------------------
+# Photo derivative helpers
+# -------------------------------
+# Extra formats for app-facing renditions, best first; AVIF only if this Pillow build has it
+MODERN_IMAGE_FORMATS = [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+
+PIL_FORMAT_NAMES = {'jpeg': 'JPEG', 'webp': 'WEBP', 'avif': 'AVIF'}
+
+
+def encode_image(img, fmt='jpeg', quality=85):
+    img_io = io.BytesIO()
+    img.save(img_io, format=PIL_FORMAT_NAMES[fmt], quality=quality)
+    return img_io.getvalue()
+
+
+def encode_jpeg(img, quality=85):
+    return encode_image(img, 'jpeg', quality)
+
+
+def build_renditions(fileobj, renditions):
+    """
+    Decode an uploaded photo once and return {name: {format: bytes}} for every
+    rendition in `renditions` (dicts with 'name', 'size', 'quality' and optional
+    'formats'). Every rendition gets a 'jpeg'; extra formats are only encoded when
+    this Pillow build supports them. Renditions are produced largest first, each
+    one downscaled from the previous, so the full-size original is only resampled once.
+    """
+    renditions = sorted(renditions, key=lambda r: r['size'][0] * r['size'][1], reverse=True)
+    img = open_downscaled(fileobj, *renditions[0]['size'])
+    img = img.convert("RGB")
+
+    outputs = {}
+    for rendition in renditions:
+        img.thumbnail(rendition['size'], Image.LANCZOS)
+        quality = rendition.get('quality', 85)
+        outputs[rendition['name']] = {'jpeg': encode_jpeg(img, quality)}
+        for fmt in rendition.get('formats', ()):
+            if fmt in MODERN_IMAGE_FORMATS:
+                outputs[rendition['name']][fmt] = encode_image(img, fmt, quality)
+
+    img.close()
+    return outputs
+
+
+# -------------------------------
+# Batch jobs (top-level so they can run in the image pool)
+# -------------------------------
+def process_photo(data, renditions):
+    """
+    Full derivative job for one original: ingest normalization + renditions.
+    Returns {'normalized': bytes or None if unchanged, 'metadata': ..., 'renditions': ...}.
+    """
+    normalized, metadata = normalize_photo(data)
+    outputs = build_renditions(io.BytesIO(normalized), renditions)
+    return {
+        'normalized': normalized if normalized != data else None,
+        'metadata': metadata,
+        'renditions': outputs,
+    }
+
+
+# A stored JPEG up to this many times the PDF image box (per side) is embedded
+# as-is and scaled by the PDF viewer instead of being decoded and re-encoded
+PDF_PASSTHROUGH_OVERSIZE = 2
+
+
+def jpeg_passthrough_size(data, max_size):
+    """
+    (width, height) of `data` if it can go into a PDF unchanged: a JPEG that
+    ReportLab embeds with DCTDecode (RGB or greyscale, no pending EXIF
+    rotation) and no larger than PDF_PASSTHROUGH_OVERSIZE x max_size.
+    Only the header is read. None otherwise.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.format != 'JPEG' or img.mode not in ('RGB', 'L'):
+            return None
+        if img.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            return None
+    except Exception:
+        return None
+    if img.width > max_size[0] * PDF_PASSTHROUGH_OVERSIZE or img.height > max_size[1] * PDF_PASSTHROUGH_OVERSIZE:
+        return None
+    return img.size
+
+
+def prepare_pdf_image(data, max_size, quality=85):
+    """
+    Fit one photo into a PDF image box. Returns (JPEG bytes, (width, height)),
+    or None when there was nothing to read. Stored renditions that already
+    fit (jpeg_passthrough_size) come back untouched, so the returned size can
+    exceed max_size: draw the image scaled into the box.
+    """
+    if not data:
+        return None
+    size = jpeg_passthrough_size(data, max_size)
+    if size:
+        return data, size
+
+    img = open_downscaled(io.BytesIO(data), *max_size)
+    img = img.convert("RGB")
+    img.thumbnail(max_size, Image.LANCZOS)
+    size = img.size
+    encoded = encode_jpeg(img, quality)
+    img.close()
+    return encoded, size
+
+
+# -------------------------------
+# Shared image-processing engine
+# -------------------------------
+_image_pool = None
+_image_pool_lock = threading.Lock()
+# Set once the pool turned out impossible in this process (e.g. a daemonic
+# Celery prefork child); everything then runs inline
+_image_pool_unavailable = False
+
+# Raised by submit() when the pool cannot start its processes
+POOL_START_ERRORS = (BrokenProcessPool, RuntimeError, OSError, AssertionError)
+
+
+def image_pool_size():
+    from django.conf import settings
+    return getattr(settings, 'IMAGE_POOL_WORKERS', None) or os.cpu_count() or 1
+
+
+def _in_daemon_process():
+    """
+    True inside daemonic processes, which may not have children: Celery's
+    prefork pool children (billiard) in particular. Celery concurrency
+    already spreads the work across cores there.
+    """
+    if multiprocessing.current_process().daemon:
+        return True
+    try:
+        from billiard.process import current_process as billiard_current_process
+    except ImportError:
+        return False
+    return bool(billiard_current_process().daemon)
+
+
+def get_image_pool():
+    """
+    Process pool shared by everything in this process that decodes/encodes
+    photos. Created lazily; None (run inline) when IMAGE_POOL_WORKERS is 1,
+    inside a daemonic worker process, or after the pool failed to start.
+    """
+    global _image_pool, _image_pool_unavailable
+    size = image_pool_size()
+    if size <= 1 or _image_pool_unavailable:
+        return None
+    if _in_daemon_process():
+        _image_pool_unavailable = True
+        return None
+
+    with _image_pool_lock:
+        if _image_pool is None:
+            # forkserver children start clean (no copies of DB connections or SDK threads)
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            try:
+                _image_pool = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context(method))
+            except (ValueError, OSError) as e:
+                print(f"Image pool could not be created, running inline: {e}")
+                _image_pool_unavailable = True
+                return None
+        return _image_pool
+
+
+def _reset_image_pool(error=None):
+    """
+    Drop the pool after a failure. It is rebuilt on next use unless it could
+    not start processes at all (AssertionError from a daemonic process).
+    """
+    global _image_pool, _image_pool_unavailable
+    with _image_pool_lock:
+        if _image_pool is not None:
+            _image_pool.shutdown(wait=False, cancel_futures=True)
+        _image_pool = None
+        if isinstance(error, AssertionError):
+            _image_pool_unavailable = True
+
+
+def _run_job(func, job):
+    try:
+        return func(*job)
+    except Exception as e:
+        print(f"Image job {func.__name__} failed: {e}")
+        return None
+
+
+def process_images(func, jobs):
+    """
+    Run func(*job) for every job in `jobs` on the shared image pool and return
+    the results in job order. A job that raises gives None. Falls back to
+    running inline when the pool is disabled, unavailable or broken.
+    """
+    jobs = list(jobs)
+    pool = get_image_pool() if len(jobs) > 1 else None
+    if pool is None:
+        return [_run_job(func, job) for job in jobs]
+
+    try:
+        futures = [pool.submit(func, *job) for job in jobs]
+    except POOL_START_ERRORS as e:
+        print(f"Image pool unavailable, running inline: {e!r}")
+        _reset_image_pool(e)
+        return [_run_job(func, job) for job in jobs]
+
+    results = []
+    for future, job in zip(futures, jobs):
+        try:
+            results.append(future.result())
+        except BrokenProcessPool:
+            _reset_image_pool()
+            results.append(_run_job(func, job))
+        except Exception as e:
+            print(f"Image job {func.__name__} failed: {e}")
+            results.append(None)
+    return results
+
+
+def prefetch_images(func, fetch, items, args=(), workers=None):
+    """
+    Yield func(fetch(item), *args) for every item, in order, while the items
+    after it are still being fetched and processed. Up to `workers` (default
+    PDF_FETCH_WORKERS) threads each fetch one item's bytes from storage and
+    hand them straight to the shared image pool, so a batch takes about as
+    long as its slowest photo. A failed fetch or job gives None.
+    """
+    from django.conf import settings
+    items = list(items)
+    if not items:
+        return
+    workers = min(workers or getattr(settings, 'PDF_FETCH_WORKERS', 8), len(items))
+
+    def stage(item):
+        try:
+            job = (fetch(item),) + tuple(args)
+        except Exception as e:
+            print(f"Image fetch for {func.__name__} failed: {e}")
+            return None
+        pool = get_image_pool() if len(items) > 1 else None
+        if pool is None:
+            return _run_job(func, job)
+        try:
+            future = pool.submit(func, *job)
+        except POOL_START_ERRORS as e:
+            print(f"Image pool unavailable, running inline: {e!r}")
+            _reset_image_pool(e)
+            return _run_job(func, job)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            _reset_image_pool()
+            return _run_job(func, job)
+        except Exception as e:
+            print(f"Image job {func.__name__} failed: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as threads:
+        futures = [threads.submit(bind_storage_io(stage), item) for item in items]
+        for future in futures:
+            yield future.result()
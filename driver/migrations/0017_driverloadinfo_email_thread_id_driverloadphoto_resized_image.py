@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('driver', '0016_driverloadinfo_equipment_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driverloadinfo',
+            name='email_thread_id',
+            field=models.CharField(blank=True, help_text='Unique Message-ID base for threading', max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='resized_image',
+            field=models.ImageField(blank=True, null=True, upload_to='driver_uploads/resized/'),
+        ),
+    ]
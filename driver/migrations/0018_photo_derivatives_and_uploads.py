@@ -0,0 +1,137 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:47
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+def mark_existing_photos(apps, schema_editor):
+    """
+    Photos stored before the derivative worker already have their resized
+    image: mark them ready so the backfill leaves them alone. The others get
+    their renditions built, but no existing original is rewritten
+    (normalize_original is False for every row present now).
+    """
+    DriverLoadPhoto = apps.get_model('driver', 'DriverLoadPhoto')
+    DriverLoadPhoto.objects.exclude(resized_image__isnull=True).exclude(resized_image='')\
+        .update(derivatives_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('driver', '0017_driverloadinfo_email_thread_id_driverloadphoto_resized_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoadPhotoSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('photo_type', models.CharField(max_length=50)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+                ('load', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photo_sequences', to='driver.driverloadinfo')),
+            ],
+            options={
+                'unique_together': {('load', 'photo_type')},
+            },
+        ),
+        migrations.AddField(
+            model_name='driverloadinfo',
+            name='pdf_cache',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='alt_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='captured_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='content_digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='derivatives_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='derivatives_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('deferred', 'Deferred'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='gps_latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='gps_longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        # Existing rows get False, new photos True (see mark_existing_photos)
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='normalize_original',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='driverloadphoto',
+            name='normalize_original',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='original_rehydrated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='original_tier',
+            field=models.CharField(choices=[('hot', 'Hot'), ('cool', 'Cool'), ('archive', 'Archive'), ('rehydrating', 'Rehydrating')], db_index=True, default='hot', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='original_tier_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='print_image',
+            field=models.ImageField(blank=True, null=True, upload_to='driver_uploads/print/'),
+        ),
+        migrations.AddField(
+            model_name='driverloadphoto',
+            name='thumbnail_image',
+            field=models.ImageField(blank=True, null=True, upload_to='driver_uploads/thumb/'),
+        ),
+        migrations.AddIndex(
+            model_name='driverloadphoto',
+            index=models.Index(fields=['load', 'photo_type', 'content_digest'], name='driver_photo_type_digest_idx'),
+        ),
+        migrations.RunPython(mark_existing_photos, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ResumableUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('photo_type', models.CharField(max_length=50)),
+                ('file_name', models.CharField(max_length=255)),
+                ('content_type', models.CharField(default='image/jpeg', max_length=100)),
+                ('total_size', models.PositiveBigIntegerField()),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('blob_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('uploaded', 'Uploaded'), ('committed', 'Committed')], db_index=True, default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('load', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumable_uploads', to='driver.driverloadinfo')),
+                ('photo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='driver.driverloadphoto')),
+            ],
+        ),
+    ]
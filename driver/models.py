@@ -1,9 +1,11 @@
-from django.db import models
+from django.db import connection, models
 import os
 import uuid
-from PIL import Image
-import io
 from django.core.files.base import ContentFile
+from django.utils import timezone
+import hashlib
+
+from backend.azure_storage import overwrite_storage_blob, read_storage_bytes
 
 
 # -------------------------------
@@ -18,18 +20,72 @@ def load_file_name(instance, filename, file_type):
     # Get load_number
     load_number = getattr(instance, 'load_number', getattr(instance, 'load', None) and getattr(instance.load, 'load_number', 'UNKNOWN'))
 
-    # Count existing files for this load and type
-    existing_count = 0
-    if hasattr(instance, 'load') and instance.load:
-        existing_count = instance.load.photos.filter(photo_type=file_type).count()
-    elif hasattr(instance, 'photo_type'):
-        # fallback: try instance.photo_type
-        existing_count = DriverLoadPhoto.objects.filter(load=getattr(instance, 'load', None), photo_type=file_type).count()
+    # Next number from the per-load counter (no COUNT, safe under concurrent uploads)
+    sequence = 1
+    if getattr(instance, 'load', None):
+        sequence = reserve_photo_sequence(instance.load, file_type)
+    return load_photo_name(load_number, file_type, sequence, ext)
 
-    sequence = existing_count + 1  # start from 1
-    new_filename = f"{load_number}_{file_type}_{sequence}.{ext}"
+def load_photo_name(load_number, file_type, sequence, ext, unique=False):
+    """
+    Storage path for one load file: driver_uploads/<type>/<LOAD>_<type>_<n>.<ext>
+    With `unique`, a random suffix is added (<LOAD>_<type>_<n>_<hex>.<ext>).
+    """
+    suffix = f"_{uuid.uuid4().hex[:8]}" if unique else ""
+    new_filename = f"{load_number}_{file_type}_{sequence}{suffix}.{ext}"
     return os.path.join('driver_uploads', file_type, new_filename)
 
+def reserve_photo_name(load, photo_type, ext):
+    """
+    Name for a photo blob written without storage.save() (staged blocks,
+    direct and resumable uploads), so get_available_name never runs.
+    Load numbers repeat across loads and counters seeded from COUNT can
+    hand out an older photo's number, so the name is made unique.
+    """
+    return load_photo_name(load.load_number, photo_type, reserve_photo_sequence(load, photo_type), ext, unique=True)
+
+def reserve_photo_sequence(load, photo_type, count=1):
+    """
+    Reserve `count` consecutive sequence numbers for (load, photo_type) and
+    return the first. One atomic UPDATE ... RETURNING on LoadPhotoSequence;
+    the counter row is created on first use, seeded from the existing photos.
+    """
+    table = connection.ops.quote_name(LoadPhotoSequence._meta.db_table)
+    sql = f"UPDATE {table} SET last_value = last_value + %s WHERE load_id = %s AND photo_type = %s RETURNING last_value"
+
+    for _ in range(2):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [count, load.pk, photo_type])
+            row = cursor.fetchone()
+        if row:
+            return row[0] - count + 1
+        # First upload of this type for the load (or a load from before the counter)
+        LoadPhotoSequence.objects.get_or_create(
+            load=load,
+            photo_type=photo_type,
+            defaults={'last_value': DriverLoadPhoto.objects.filter(load=load, photo_type=photo_type).count()},
+        )
+    raise RuntimeError(f"Could not reserve photo sequence for load {load.pk} / {photo_type}")
+
+def allocate_photo_sequences(load, counts):
+    """
+    Reserve sequence numbers for a batch of new photos on one load.
+    `counts` is {photo_type: number of files}; returns {photo_type: first number}.
+    One UPDATE per photo type, whatever the number of files.
+    """
+    return {photo_type: reserve_photo_sequence(load, photo_type, count) for photo_type, count in counts.items()}
+
+def file_digest(file):
+    """
+    SHA-256 hex digest of an uploaded file, read chunk by chunk
+    so large photos never sit in memory twice.
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
 def bol_upload_to(instance, filename):
     return load_file_name(instance, filename, 'BOL')
 
@@ -151,6 +207,8 @@ class DriverLoadInfo(models.Model):
     status = models.CharField(max_length=20, choices=LOAD_STATUS_CHOICES, default='pending_pickup')
     last_notification_sent = models.DateTimeField(null=True, blank=True)
     email_thread_id = models.CharField(max_length=255, null=True, blank=True, help_text="Unique Message-ID base for threading")
+    # Blob of the last generated load PDF (see driver.utils.cached_load_pdf)
+    pdf_cache = models.CharField(max_length=255, blank=True, default='', editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -187,6 +245,15 @@ class DriverLoadInfo(models.Model):
 MAX_WIDTH = 800
 MAX_HEIGHT = 800
 
+# Renditions built from one decode of the original, smallest first.
+# Consumers call DriverLoadPhoto.best_rendition() to pick the smallest one that fits.
+# 'formats' are extra encodings (besides JPEG) for app-facing renditions, see alt_renditions.
+PHOTO_RENDITIONS = [
+    {'name': 'thumb', 'field': 'thumbnail_image', 'size': (128, 128), 'quality': 80, 'formats': ('avif', 'webp')},
+    {'name': 'preview', 'field': 'resized_image', 'size': (MAX_WIDTH, MAX_HEIGHT), 'quality': 85, 'formats': ('avif', 'webp')},
+    {'name': 'print', 'field': 'print_image', 'size': (1600, 1600), 'quality': 85},
+]
+
 class DriverLoadPhoto(models.Model):
     load = models.ForeignKey(
         DriverLoadInfo,
@@ -206,37 +273,289 @@ class DriverLoadPhoto(models.Model):
         ]
     )
     image = models.ImageField(upload_to=driver_photo_upload_to)
+    thumbnail_image = models.ImageField(
+        upload_to='driver_uploads/thumb/',
+        null=True,
+        blank=True
+    )
     resized_image = models.ImageField(
         upload_to='driver_uploads/resized/', 
         null=True, 
         blank=True
     )
+    print_image = models.ImageField(
+        upload_to='driver_uploads/print/',
+        null=True,
+        blank=True
+    )
+    # WebP/AVIF copies of renditions: {"thumb": {"webp": "<blob name>", ...}, ...}
+    alt_renditions = models.JSONField(default=dict, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # SHA-256 of the uploaded bytes, used to skip re-uploads of the same photo
+    content_digest = models.CharField(max_length=64, null=True, blank=True)
+    # Kept from EXIF at ingest; the stored original has its metadata stripped
+    captured_at = models.DateTimeField(null=True, blank=True)
+    gps_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    gps_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+
+    # Derivatives (see PHOTO_RENDITIONS) are built by a background worker after upload
+    DERIVATIVE_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('deferred', 'Deferred'),  # over the PHOTO_UPLOAD_LIMITS pixel budget, left to the backfill
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    derivatives_status = models.CharField(
+        max_length=10,
+        choices=DERIVATIVE_STATUS_CHOICES,
+        default='pending',
+        db_index=True
+    )
+    # Failed builds so far; the backfill gives up after DERIVATIVE_MAX_ATTEMPTS
+    derivatives_attempts = models.PositiveSmallIntegerField(default=0)
+    # False for photos stored before ingest normalization: their original is
+    # kept byte for byte, only the renditions are built from it
+    normalize_original = models.BooleanField(default=True)
+    # Storage tier of the original only; renditions always stay hot.
+    # Set by driver.tasks.tier_delivered_originals / rehydrate_original.
+    ORIGINAL_TIER_CHOICES = [
+        ('hot', 'Hot'),
+        ('cool', 'Cool'),
+        ('archive', 'Archive'),
+        ('rehydrating', 'Rehydrating'),  # archive -> hot in progress (hours)
+    ]
+    original_tier = models.CharField(
+        max_length=12,
+        choices=ORIGINAL_TIER_CHOICES,
+        default='hot',
+        db_index=True
+    )
+    original_tier_changed_at = models.DateTimeField(null=True, blank=True)
+    # Last time a rehydration brought the original back to hot
+    original_rehydrated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['load', 'photo_type', 'content_digest'], name='driver_photo_type_digest_idx'),
+        ]
 
     def __str__(self):
         return f"{self.load.load_number} - {self.photo_type}"
 
+    @property
+    def derivatives_ready(self):
+        return self.derivatives_status == 'ready'
+
+    @property
+    def original_online(self):
+        """False while the original is archived or being rehydrated (reads would fail)."""
+        return self.original_tier not in ('archive', 'rehydrating')
+
+    def request_original(self):
+        """
+        True if the original can be read now. Otherwise queues its rehydration
+        (once) and returns False; callers fall back to the renditions.
+        """
+        if self.original_online:
+            return True
+        if self.original_tier == 'archive':
+            from .tasks import queue_original_rehydration
+            queue_original_rehydration(self)
+        return False
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)  # Save original first
-
-        # Only create resized_image if not already present
-        if self.image and not self.resized_image:
-            try:
-                img = Image.open(self.image)
-                img = img.convert("RGB")
-                img.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.ANTIALIAS)
-
-                # Save to in-memory file
-                img_io = io.BytesIO()
-                img.save(img_io, format='JPEG', quality=85)
-
-                # Save to resized_image field
-                filename = self.image.name.split('/')[-1]
-                self.resized_image.save(f"resized_{filename}", ContentFile(img_io.getvalue()), save=False)
-                super().save(update_fields=['resized_image'])  # Save resized image only
-
-            except Exception as e:
-                print(f"Error resizing image {self.image.name}: {e}")
+        is_new = self._state.adding
+        if is_new and self.image and not self.content_digest:
+            self.content_digest = file_digest(self.image)
+        super().save(*args, **kwargs)  # Store the original only
+
+        # Queue derivative generation (runs inline when PHOTO_DERIVATIVES_EAGER is on).
+        # Deferred (oversized) photos wait for backfill_photo_derivatives instead.
+        if is_new and self.image and not self.resized_image and self.derivatives_status != 'deferred':
+            from .tasks import queue_photo_derivatives
+            queue_photo_derivatives(self)
+
+    def rendition(self, name):
+        """
+        Return the stored file for a named rendition ('thumb', 'preview', 'print'),
+        or None if it has not been built yet.
+        """
+        for rendition in PHOTO_RENDITIONS:
+            if rendition['name'] == name:
+                file = getattr(self, rendition['field'])
+                return file if file else None
+        return None
+
+    def rendition_name(self, name, formats=()):
+        """
+        Blob name of a rendition in the first of `formats` that was built
+        (e.g. ['avif', 'webp']), falling back to the JPEG rendition.
+        """
+        alternates = self.alt_renditions.get(name, {})
+        for fmt in formats:
+            if fmt in alternates:
+                return alternates[fmt]
+        file = self.rendition(name)
+        return file.name if file else None
+
+    def best_rendition(self, max_width, max_height):
+        """
+        Smallest stored rendition that still covers a (max_width, max_height) box.
+        Falls back to the largest rendition available, then to the original.
+        """
+        available = [r for r in PHOTO_RENDITIONS if getattr(self, r['field'])]
+        for rendition in available:
+            width, height = rendition['size']
+            if width >= max_width and height >= max_height:
+                return getattr(self, rendition['field'])
+        if available:
+            return getattr(self, available[-1]['field'])
+        # Never block on an archived original: ask for it back and skip this time
+        return self.image if self.request_original() else None
+
+    def stored_names(self):
+        """Every blob this photo owns: original, renditions and their WebP/AVIF copies."""
+        names = [f.name for f in (self.image, self.thumbnail_image, self.resized_image, self.print_image) if f]
+        for formats in (self.alt_renditions or {}).values():
+            names.extend(formats.values())
+        return names
+
+    def read_original(self, length=None):
+        """Original bytes, or only the first `length` (header / EXIF inspection)."""
+        return read_storage_bytes(self.image.name, length, storage=self.image.storage)
+
+    def store_ingest(self, normalized, metadata):
+        """
+        Ingest stage result: keep capture time / GPS in DB columns and, if the
+        original had to be rotated or stripped, replace the stored blob with the
+        normalized bytes (see driver.images.normalize_photo). Originals of
+        photos from before normalization (normalize_original False) stay as is.
+        """
+        if metadata['captured_at']:
+            self.captured_at = timezone.make_aware(metadata['captured_at'])
+        self.gps_latitude = metadata['gps_latitude']
+        self.gps_longitude = metadata['gps_longitude']
+
+        if normalized is not None and self.normalize_original:
+            # Same blob name: upload responses already handed out its URL
+            self.image.name = overwrite_storage_blob(self.image.name, ContentFile(normalized), storage=self.image.storage)
+
+    def build_derivatives(self, processed=None):
+        """
+        Normalize the original and build every rendition in PHOTO_RENDITIONS.
+        `processed` is a driver.images.process_photo result when the caller
+        already ran the CPU work in the image pool (batch backfill); otherwise
+        it runs here. Called by the worker, never on the request path.
+        """
+        from .images import process_photo
+
+        if not self.image:
+            return
+        if not self.request_original():
+            return  # rebuilt by the backfill once the original is back online
+
+        try:
+            if processed is None:
+                data = self.read_original()
+                if not self.content_digest:  # direct uploads never passed through the web worker
+                    self.content_digest = hashlib.sha256(data).hexdigest()
+                processed = process_photo(data, PHOTO_RENDITIONS)
+            self.store_ingest(processed['normalized'], processed['metadata'])
+            outputs = processed['renditions']
+
+            filename = self.image.name.split('/')[-1]
+            stem = os.path.splitext(filename)[0]
+            update_fields = ['derivatives_status', 'image', 'content_digest', 'captured_at', 'gps_latitude', 'gps_longitude', 'alt_renditions']
+            alt_renditions = {}
+            for rendition in PHOTO_RENDITIONS:
+                encoded = outputs[rendition['name']]
+                field = getattr(self, rendition['field'])
+                field.save(f"{rendition['name']}_{filename}", ContentFile(encoded['jpeg']), save=False)
+                update_fields.append(rendition['field'])
+
+                # WebP/AVIF copies sit next to the JPEG rendition
+                upload_dir = self._meta.get_field(rendition['field']).upload_to
+                for fmt, data in encoded.items():
+                    if fmt == 'jpeg':
+                        continue
+                    alt_name = os.path.join(upload_dir, f"{rendition['name']}_{stem}.{fmt}")
+                    alt_renditions.setdefault(rendition['name'], {})[fmt] = field.storage.save(alt_name, ContentFile(data))
+
+            self.alt_renditions = alt_renditions
+
+            self.derivatives_status = 'ready'
+            super().save(update_fields=update_fields)
+
+        except Exception as e:
+            print(f"Error building renditions for {self.image.name}: {e}")
+            self.derivatives_status = 'failed'
+            self.derivatives_attempts += 1
+            super().save(update_fields=['derivatives_status', 'derivatives_attempts', 'image'])
+
+
+class LoadPhotoSequence(models.Model):
+    """
+    Last file sequence number handed out per load and photo type
+    (LOAD123_trailer_<n>.jpg). Advanced by reserve_photo_sequence.
+    """
+    load = models.ForeignKey(
+        DriverLoadInfo,
+        on_delete=models.CASCADE,
+        related_name="photo_sequences"
+    )
+    photo_type = models.CharField(max_length=50)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('load', 'photo_type')
+
+    def __str__(self):
+        return f"{self.load.load_number} {self.photo_type}: {self.last_value}"
+
+
+class ResumableUpload(models.Model):
+    """
+    One photo uploaded in numbered chunks, each staged as a blob block, so a
+    dropped cellular connection only costs the chunks that did not arrive.
+    Storage's uncommitted block list is the record of received chunks.
+    'uploaded' means the blocks are committed but the photo is not registered
+    yet (finalize failed after the commit). Abandoned sessions are removed by driver.tasks.cleanup_resumable_uploads.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('uploaded', 'Uploaded'),
+        ('committed', 'Committed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    load = models.ForeignKey(
+        DriverLoadInfo,
+        on_delete=models.CASCADE,
+        related_name="resumable_uploads"
+    )
+    photo_type = models.CharField(max_length=50)
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, default='image/jpeg')
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    blob_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open', db_index=True)
+    photo = models.ForeignKey(DriverLoadPhoto, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # last chunk received
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def chunk_length(self, index):
+        """Expected byte length of chunk `index` (the last one may be short)."""
+        if index < self.chunk_count - 1:
+            return self.chunk_size
+        return self.total_size - self.chunk_size * (self.chunk_count - 1)
+
+    def __str__(self):
+        return f"{self.load.load_number} {self.photo_type} {self.file_name} ({self.status})"
 
 # -------------------------------
 # Company & Customer
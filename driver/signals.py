@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import DriverLoadInfo, DriverLoadPhoto
+from .tasks import queue_blob_deletion
+
+
+# -------------------------------
+# Blob cleanup on delete
+# -------------------------------
+# Queryset deletes (update_upload_api, save_delivery_info_api) and cascades
+# from a deleted load never call Model.delete(), but post_delete still fires
+# per row, so blobs are cleaned up whichever way the rows go.
+@receiver(post_delete, sender=DriverLoadPhoto)
+def remove_photo_blobs(sender, instance, **kwargs):
+    queue_blob_deletion(instance.stored_names())
+
+
+@receiver(post_delete, sender=DriverLoadInfo)
+def remove_load_files(sender, instance, **kwargs):
+    queue_blob_deletion([f.name for f in (instance.bol, instance.pod) if f] + [instance.pdf_cache])
@@ -1 +1,303 @@
+import hashlib
 
+from celery import shared_task
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+
+from backend.azure_storage import delete_storage_blobs
+from backend.storage_metrics import storage_io
+from .images import image_pool_size, process_images, process_photo
+from .models import DriverLoadInfo, DriverLoadPhoto, PHOTO_RENDITIONS, ResumableUpload
+
+
+# -------------------------------
+# Photo derivatives
+# -------------------------------
+@shared_task
+def generate_photo_derivatives(photo_id):
+    """
+    Build the resized derivative(s) for one DriverLoadPhoto.
+    Queued after upload so the request only stores the original.
+    """
+    photo = DriverLoadPhoto.objects.filter(id=photo_id).first()
+    if not photo:
+        return
+    if photo.derivatives_ready:
+        return
+    photo.build_derivatives()
+
+
+@shared_task
+def backfill_photo_derivatives(limit=500, batch_size=None):
+    """
+    Build derivatives for photos still pending, deferred or failed (uploads
+    from before the worker existed, photos over the upload pixel budget,
+    worker crashes). Runs every 15 minutes from CELERY_BEAT_SCHEDULE. Originals are read a batch at a
+    time and decoded/encoded on the shared image pool, one photo per core.
+    Photos that failed DERIVATIVE_MAX_ATTEMPTS times are left alone, and the
+    ones with the fewest failures go first, so broken files never starve new uploads.
+    Pending uploads younger than DERIVATIVE_BACKFILL_GRACE_MINUTES still have
+    their generate_photo_derivatives job queued and are skipped, so no photo
+    is built twice.
+    """
+    batch_size = batch_size or image_pool_size() * 2
+    queued_since = timezone.now() - timedelta(minutes=settings.DERIVATIVE_BACKFILL_GRACE_MINUTES)
+    photos = list(
+        DriverLoadPhoto.objects.exclude(derivatives_status='ready')
+        .exclude(derivatives_status='pending', uploaded_at__gte=queued_since)
+        .exclude(image='')
+        .exclude(original_tier__in=['archive', 'rehydrating'])
+        .exclude(derivatives_status='failed', derivatives_attempts__gte=settings.DERIVATIVE_MAX_ATTEMPTS)
+        .order_by('derivatives_attempts', 'id')[:limit]
+    )
+
+    for start in range(0, len(photos), batch_size):
+        batch = []
+        for photo in photos[start:start + batch_size]:
+            try:
+                data = photo.read_original()
+                if not photo.content_digest:
+                    photo.content_digest = hashlib.sha256(data).hexdigest()
+                batch.append((photo, data))
+            except Exception as e:
+                print(f"Error reading original for photo {photo.id}: {e}")
+                photo.build_derivatives()  # records the failure
+
+        results = process_images(process_photo, [(data, PHOTO_RENDITIONS) for _, data in batch])
+        for (photo, _), processed in zip(batch, results):
+            # A failed pool job is retried inline so the photo gets a proper status
+            photo.build_derivatives(processed=processed)
+
+    return len(photos)
+
+
+def queue_photo_derivatives(photo):
+    """
+    Hand a freshly uploaded photo to the derivative worker once the upload
+    transaction commits. With PHOTO_DERIVATIVES_EAGER the work runs inline.
+    """
+    if getattr(settings, 'PHOTO_DERIVATIVES_EAGER', False):
+        generate_photo_derivatives(photo.id)
+        return
+
+    photo_id = photo.id
+
+    def _enqueue():
+        try:
+            generate_photo_derivatives.delay(photo_id)
+        except Exception as e:
+            # Broker unavailable: photo stays 'pending' and backfill picks it up later
+            print(f"Error queueing derivatives for photo {photo_id}: {e}")
+
+    transaction.on_commit(_enqueue)
+
+
+# -------------------------------
+# Upload housekeeping
+# -------------------------------
+@shared_task
+def cleanup_resumable_uploads():
+    """
+    Drop resumable upload sessions idle for RESUMABLE_UPLOAD_TTL_HOURS, and
+    committed ones after the same delay. Staged blocks (or the committed but
+    never registered blob) of abandoned sessions are deleted where the
+    storage allows it (Azure also discards
+    uncommitted blocks by itself after 7 days).
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.RESUMABLE_UPLOAD_TTL_HOURS)
+    stale = ResumableUpload.objects.filter(updated_at__lt=cutoff)
+
+    for upload in stale.filter(status__in=['open', 'uploaded']):
+        try:
+            with storage_io("delete"):
+                default_storage.client.get_blob_client(upload.blob_name).delete_blob()
+        except Exception:
+            pass  # nothing committed under that name: only uncommitted blocks, left to expire
+
+    count, _ = stale.delete()
+    return count
+
+
+@shared_task
+def delete_stored_blobs(names):
+    """Remove the blobs of deleted photos / loads in batch requests."""
+    delete_storage_blobs(names)
+    return len(names)
+
+
+def queue_blob_deletion(names):
+    """
+    Queue blob removal for rows being deleted, once the delete commits.
+    Called from the post_delete handlers in driver.signals.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+
+    def _enqueue():
+        if getattr(settings, 'PHOTO_DERIVATIVES_EAGER', False):
+            delete_stored_blobs(names)
+            return
+        try:
+            delete_stored_blobs.delay(names)
+        except Exception as e:
+            # Broker unavailable: sweep_orphan_blobs removes them later
+            print(f"Error queueing deletion of {len(names)} blobs: {e}")
+
+    transaction.on_commit(_enqueue)
+
+
+def _referenced_blob_names():
+    """Every blob name the database points at (photos, renditions, load BOL/POD files)."""
+    names = set()
+    photo_rows = DriverLoadPhoto.objects.values_list(
+        'image', 'thumbnail_image', 'resized_image', 'print_image', 'alt_renditions'
+    )
+    for row in photo_rows.iterator(chunk_size=2000):
+        names.update(name for name in row[:4] if name)
+        for formats in (row[4] or {}).values():
+            names.update(formats.values())
+    for row in DriverLoadInfo.objects.values_list('bol', 'pod').iterator(chunk_size=2000):
+        names.update(name for name in row if name)
+    return names
+
+
+@shared_task
+def sweep_orphan_blobs(prefix='driver_uploads/', min_age_hours=None, dry_run=False):
+    """
+    Delete blobs under `prefix` that no row references (deletes from before
+    blob cleanup existed, lost queue messages, abandoned direct uploads).
+    References are loaded once, then the container is listed page by page
+    and each page's orphans go out in one batch delete. Blobs younger than
+    ORPHAN_SWEEP_MIN_AGE_HOURS are left alone: they may be uploads that are
+    not registered yet.
+    """
+    if not hasattr(default_storage, 'iter_blob_pages'):
+        return 0
+
+    if min_age_hours is None:
+        min_age_hours = settings.ORPHAN_SWEEP_MIN_AGE_HOURS
+    cutoff = timezone.now() - timedelta(hours=min_age_hours)
+    referenced = _referenced_blob_names()
+
+    removed = 0
+    for page in default_storage.iter_blob_pages(prefix, settings.ORPHAN_SWEEP_PAGE_SIZE):
+        orphans = [name for name, last_modified in page if name not in referenced and last_modified < cutoff]
+        if orphans and not dry_run:
+            delete_storage_blobs(orphans)
+        removed += len(orphans)
+
+    print(f"Orphan sweep of {prefix}: {removed} blobs {'found' if dry_run else 'deleted'}")
+    return removed
+
+
+# -------------------------------
+# Storage tiering of originals
+# -------------------------------
+@shared_task
+def tier_delivered_originals(limit=5000):
+    """
+    Move originals of delivered loads out of the hot tier: to Archive after
+    ORIGINAL_ARCHIVE_AFTER_DAYS, to Cool after ORIGINAL_COOL_AFTER_DAYS
+    (0 turns a step off). Only photos with their renditions built qualify,
+    so the app and the PDFs keep reading hot renditions. Originals brought
+    back by a rehydration wait another full period (counted from the
+    rehydration) before moving again; the others go by delivery age only.
+    """
+    if not hasattr(default_storage, 'set_tier_many'):
+        return 0
+
+    now = timezone.now()
+    moved = 0
+    steps = [
+        ('archive', settings.ORIGINAL_ARCHIVE_AFTER_DAYS, ['hot', 'cool']),
+        ('cool', settings.ORIGINAL_COOL_AFTER_DAYS, ['hot']),
+    ]
+    for tier, days, from_tiers in steps:
+        if not days:
+            continue
+        cutoff = now - timedelta(days=days)
+        photos = list(
+            DriverLoadPhoto.objects.filter(
+                load__status='delivered',
+                load__delivery_datetime__lt=cutoff,
+                derivatives_status='ready',
+                original_tier__in=from_tiers,
+            )
+            .filter(Q(original_rehydrated_at__isnull=True) | Q(original_rehydrated_at__lt=cutoff))
+            .exclude(image='')
+            .values_list('id', 'image')[:limit]
+        )
+        if not photos:
+            continue
+
+        default_storage.set_tier_many([name for _, name in photos], tier.capitalize())
+        DriverLoadPhoto.objects.filter(id__in=[photo_id for photo_id, _ in photos])\
+            .update(original_tier=tier, original_tier_changed_at=now)
+        moved += len(photos)
+
+    return moved
+
+
+@shared_task
+def rehydrate_original(photo_id):
+    """Start moving an archived original back to Hot; check_rehydrations sees it through."""
+    photo = DriverLoadPhoto.objects.filter(id=photo_id).first()
+    if not photo or not photo.image:
+        return
+    default_storage.set_tier_many([photo.image.name], 'Hot', rehydrate_priority=settings.ORIGINAL_REHYDRATE_PRIORITY)
+
+
+def queue_original_rehydration(photo):
+    """
+    Flag an archived original as rehydrating and queue the tier change.
+    Only the first caller queues it; later readers just see 'rehydrating'.
+    """
+    updated = DriverLoadPhoto.objects.filter(id=photo.id, original_tier='archive')\
+        .update(original_tier='rehydrating', original_tier_changed_at=timezone.now())
+    photo.original_tier = 'rehydrating'
+    if not updated:
+        return
+
+    photo_id = photo.id
+
+    def _enqueue():
+        if getattr(settings, 'PHOTO_DERIVATIVES_EAGER', False):
+            rehydrate_original(photo_id)
+            return
+        try:
+            rehydrate_original.delay(photo_id)
+        except Exception as e:
+            # check_rehydrations restarts it when the blob is still plain Archive
+            print(f"Error queueing rehydration for photo {photo_id}: {e}")
+
+    transaction.on_commit(_enqueue)
+
+
+@shared_task
+def check_rehydrations():
+    """
+    Mark originals whose rehydration finished as hot again, and restart the
+    ones that never started (lost queue message).
+    """
+    done = 0
+    for photo in DriverLoadPhoto.objects.filter(original_tier='rehydrating'):
+        try:
+            tier, archive_status = default_storage.get_tier(photo.image.name)
+        except Exception as e:
+            print(f"Error reading tier of {photo.image.name}: {e}")
+            continue
+
+        if tier == 'Hot' and not archive_status:
+            photo.original_tier = 'hot'
+            photo.original_tier_changed_at = photo.original_rehydrated_at = timezone.now()
+            photo.save(update_fields=['original_tier', 'original_tier_changed_at', 'original_rehydrated_at'])
+            done += 1
+        elif tier == 'Archive' and not archive_status:
+            rehydrate_original(photo.id)
+
+    return done
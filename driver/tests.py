@@ -1,3 +1,686 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import empty
+from PIL import Image
+from rest_framework.test import APIClient
+
+from backend.local_blob_storage import LocalBlobStorage
+from . import views
+from .images import EXIF_ORIENTATION, GPS_IFD, normalize_photo, strip_jpeg_metadata
+from .models import (
+    DriverLoadInfo,
+    DriverLoadPhoto,
+    DriverProfile,
+    ResumableUpload,
+    driver_photo_upload_to,
+    reserve_photo_name,
+    reserve_photo_sequence
+)
+from .tasks import backfill_photo_derivatives, cleanup_resumable_uploads, sweep_orphan_blobs
+from .utils import cached_load_pdf
+
+
+def make_jpeg(size=(600, 400), orientation=None, comment=None, gps=None):
+    """Noisy JPEG (so it does not compress to nothing), optionally with EXIF orientation / GPS IFD."""
+    img = Image.effect_noise(size, 60).convert('RGB')
+    exif = Image.Exif()
+    exif[0x0132] = '2024:05:01 08:30:00'
+    if orientation:
+        exif[EXIF_ORIENTATION] = orientation
+    if gps:
+        exif[GPS_IFD] = gps
+    buf = io.BytesIO()
+    save_kwargs = {'exif': exif, 'quality': 90}
+    if comment:
+        save_kwargs['comment'] = comment
+    img.save(buf, 'JPEG', **save_kwargs)
+    return buf.getvalue()
+
+
+def create_load(load_number='LN1'):
+    n = DriverProfile.objects.count() + 1
+    driver = DriverProfile.objects.create(name='Driver', phone=f'555010{n}', company='Carrier', license_number=f'L{n}')
+    return DriverLoadInfo.objects.create(
+        driver=driver,
+        truck_number='T1',
+        trailer_number='TR1',
+        customer_name='Customer',
+        load_number=load_number,
+        order_number='O1',
+        pickup_number='P1',
+        reefer_pre_cool='',
+    )
+
+
+class SignedLocalBlobStorage(LocalBlobStorage):
+    """Local emulator with fake signed URLs, so direct upload sessions can be created."""
+
+    def upload_url(self, name, expire):
+        return f"https://blob.test/{name}?sig=test"
+
+
+class InlineExecutor:
+    """ThreadPoolExecutor stand-in running each job at submit(), in the test's thread."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@override_settings(PHOTO_DERIVATIVES_EAGER=True, IMAGE_POOL_WORKERS=1)
+class LocalStorageTestCase(TestCase):
+    """Runs against the local blob emulator in a temporary MEDIA_ROOT."""
+    storage_class = LocalBlobStorage
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.storage = self.storage_class(location=media_root, base_url='/media/')
+
+        patcher = mock.patch.dict(storages._storages, {'default': self.storage})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        default_storage._wrapped = self.storage
+        self.addCleanup(setattr, default_storage, '_wrapped', empty)
+
+        self.client = APIClient()
+        self.load = create_load()
+
+
+# ----------------------------
+# Ingest normalization
+# ----------------------------
+class NormalizePhotoTests(SimpleTestCase):
+
+    def test_strip_jpeg_metadata_drops_exif_and_comments(self):
+        data = make_jpeg(comment=b'shot on a phone')
+        stripped = strip_jpeg_metadata(data)
+
+        self.assertNotIn(b'Exif\x00\x00', stripped)
+        self.assertNotIn(b'shot on a phone', stripped)
+        # Scan data is copied unchanged
+        scan = data.index(b'\xff\xda')
+        self.assertTrue(stripped.endswith(data[scan:]))
+        with Image.open(io.BytesIO(stripped)) as img:
+            self.assertEqual(img.size, (600, 400))
+
+    def test_strip_jpeg_metadata_leaves_other_data_alone(self):
+        self.assertEqual(strip_jpeg_metadata(b'not a jpeg'), b'not a jpeg')
+
+    def test_normalize_photo_applies_orientation_once(self):
+        normalized, metadata = normalize_photo(make_jpeg(orientation=6))
+
+        with Image.open(io.BytesIO(normalized)) as img:
+            self.assertEqual(img.size, (400, 600))
+            self.assertIn(img.getexif().get(EXIF_ORIENTATION), (None, 1))
+        self.assertEqual(metadata['captured_at'].isoformat(), '2024-05-01T08:30:00')
+
+    def test_normalize_photo_without_rotation_is_lossless(self):
+        data = make_jpeg()
+        normalized, _ = normalize_photo(data)
+        self.assertEqual(normalized, strip_jpeg_metadata(data))
+
+    def test_normalize_photo_reads_gps_position(self):
+        data = make_jpeg(gps={1: 'N', 2: (41.0, 30.0, 0.0), 3: 'W', 4: (87.0, 45.0, 0.0)})
+        _, metadata = normalize_photo(data)
+
+        self.assertEqual(str(metadata['gps_latitude']), '41.5')
+        self.assertEqual(str(metadata['gps_longitude']), '-87.75')
+
+    def test_normalize_photo_drops_garbled_gps_position(self):
+        data = make_jpeg(gps={1: 'N', 2: (1000.0, 0.0, 0.0), 3: 'W', 4: (87.0, 45.0, 0.0)})
+        _, metadata = normalize_photo(data)
+
+        self.assertIsNone(metadata['gps_latitude'])
+        self.assertIsNone(metadata['gps_longitude'])
+
+
+# ----------------------------
+# Photo sequence numbers
+# ----------------------------
+class PhotoSequenceTests(TestCase):
+
+    def setUp(self):
+        self.load = create_load()
+
+    def test_sequences_are_consecutive_per_type(self):
+        self.assertEqual(reserve_photo_sequence(self.load, 'trailer'), 1)
+        self.assertEqual(reserve_photo_sequence(self.load, 'trailer', count=3), 2)
+        self.assertEqual(reserve_photo_sequence(self.load, 'trailer'), 5)
+        self.assertEqual(reserve_photo_sequence(self.load, 'reefer'), 1)
+
+    def test_counter_is_seeded_from_existing_photos(self):
+        for _ in range(2):
+            DriverLoadPhoto.objects.create(load=self.load, photo_type='POD', image='')
+        self.assertEqual(reserve_photo_sequence(self.load, 'POD'), 3)
+
+    def test_upload_to_takes_numbers_from_the_counter(self):
+        names = [driver_photo_upload_to(DriverLoadPhoto(load=self.load, photo_type='reefer'), 'IMG.jpg') for _ in range(2)]
+        self.assertEqual(names, ['driver_uploads/reefer/LN1_reefer_1.jpg', 'driver_uploads/reefer/LN1_reefer_2.jpg'])
+
+    def test_reserved_names_differ_across_loads_with_the_same_number(self):
+        other = create_load(self.load.load_number)
+        first = reserve_photo_name(self.load, 'trailer', 'jpg')
+        second = reserve_photo_name(other, 'trailer', 'jpg')
+
+        self.assertTrue(first.startswith('driver_uploads/trailer/LN1_trailer_1_'))
+        self.assertTrue(second.startswith('driver_uploads/trailer/LN1_trailer_1_'))
+        self.assertNotEqual(first, second)
+
+
+# ----------------------------
+# Derivatives (PHOTO_DERIVATIVES_EAGER)
+# ----------------------------
+class EagerDerivativeTests(LocalStorageTestCase):
+
+    def test_upload_builds_renditions_inline(self):
+        photo = DriverLoadPhoto.objects.create(
+            load=self.load, photo_type='trailer', image=ContentFile(make_jpeg(orientation=6), name='IMG_1.jpg'),
+        )
+        name = photo.image.name
+        photo.refresh_from_db()
+
+        self.assertEqual(photo.derivatives_status, 'ready')
+        for field in (photo.thumbnail_image, photo.resized_image, photo.print_image):
+            self.assertTrue(self.storage.exists(field.name))
+        # Normalized in place: same name, rotated, EXIF gone
+        self.assertEqual(photo.image.name, name)
+        original = photo.read_original()
+        self.assertNotIn(b'Exif\x00\x00', original)
+        with Image.open(io.BytesIO(original)) as img:
+            self.assertEqual(img.size, (400, 600))
+        self.assertIsNotNone(photo.captured_at)
+
+    def test_broken_original_is_marked_failed(self):
+        photo = DriverLoadPhoto.objects.create(
+            load=self.load, photo_type='trailer', image=ContentFile(b'not an image', name='broken.jpg'),
+        )
+        photo.refresh_from_db()
+
+        self.assertEqual(photo.derivatives_status, 'failed')
+        self.assertEqual(photo.derivatives_attempts, 1)
+
+    def test_original_from_before_normalization_is_kept(self):
+        data = make_jpeg(orientation=6)
+        photo = DriverLoadPhoto.objects.create(
+            load=self.load, photo_type='POD', image=ContentFile(data, name='POD_1.jpg'),
+            normalize_original=False, derivatives_status='deferred',
+        )
+        photo.build_derivatives()
+        photo.refresh_from_db()
+
+        self.assertEqual(photo.derivatives_status, 'ready')
+        self.assertEqual(photo.read_original(), data)
+        with Image.open(photo.resized_image) as img:
+            self.assertGreater(img.height, img.width)
+
+
+class DerivativeBackfillTests(LocalStorageTestCase):
+
+    def create_photo(self, status, uploaded_minutes_ago, data=None, attempts=0):
+        photo = DriverLoadPhoto.objects.create(
+            load=self.load, photo_type='trailer', image=ContentFile(data or make_jpeg(), name='IMG.jpg'),
+            derivatives_status='deferred',  # no eager build on create
+        )
+        DriverLoadPhoto.objects.filter(id=photo.id).update(
+            derivatives_status=status,
+            derivatives_attempts=attempts,
+            uploaded_at=timezone.now() - timedelta(minutes=uploaded_minutes_ago),
+        )
+        return photo.id
+
+    def status(self, photo_id):
+        return DriverLoadPhoto.objects.get(id=photo_id).derivatives_status
+
+    def test_recent_pending_upload_is_left_to_its_queued_job(self):
+        grace = settings.DERIVATIVE_BACKFILL_GRACE_MINUTES
+        recent = self.create_photo('pending', grace - 5)
+        stale = self.create_photo('pending', grace + 5)
+        deferred = self.create_photo('deferred', 1)
+
+        self.assertEqual(backfill_photo_derivatives(), 2)
+        self.assertEqual(self.status(recent), 'pending')
+        self.assertEqual(self.status(stale), 'ready')
+        self.assertEqual(self.status(deferred), 'ready')
+
+    def test_photo_failing_too_often_is_no_longer_retried(self):
+        max_attempts = settings.DERIVATIVE_MAX_ATTEMPTS
+        broken = self.create_photo('failed', 60, data=b'not an image', attempts=max_attempts - 1)
+
+        self.assertEqual(backfill_photo_derivatives(), 1)
+        self.assertEqual(DriverLoadPhoto.objects.get(id=broken).derivatives_attempts, max_attempts)
+        self.assertEqual(backfill_photo_derivatives(), 0)
+
+
+# ----------------------------
+# Resumable chunked upload
+# ----------------------------
+@override_settings(RESUMABLE_CHUNK_SIZE=64 * 1024)
+class ResumableUploadTests(LocalStorageTestCase):
+
+    def start(self, load, data):
+        response = self.client.post(reverse('create_resumable_upload_api'), {
+            'load_id': load.id, 'photo_type': 'trailer', 'name': 'IMG_1.jpg', 'size': len(data),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put_chunks(self, session, data, skip=()):
+        size = session['chunk_size']
+        for index in range(session['chunk_count']):
+            if index in skip:
+                continue
+            response = self.client.put(
+                reverse('put_resumable_chunk_api', args=[session['upload_id'], index]),
+                data[index * size:(index + 1) * size],
+                content_type='application/octet-stream',
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def finalize(self, session):
+        return self.client.post(reverse('finalize_resumable_upload_api', args=[session['upload_id']]))
+
+    def test_upload_in_chunks_with_a_resent_chunk(self):
+        data = make_jpeg()
+        session = self.start(self.load, data)
+        self.assertGreater(session['chunk_count'], 2)
+        self.assertEqual(session['received'], [])
+
+        self.put_chunks(session, data, skip={1})
+        response = self.finalize(session)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['missing'], [1])
+
+        status = self.client.get(reverse('get_resumable_upload_api', args=[session['upload_id']])).json()
+        self.assertEqual(status['missing'], [1])
+
+        self.put_chunks(session, data)
+        response = self.finalize(session)
+        self.assertEqual(response.status_code, 201)
+        photo = DriverLoadPhoto.objects.get(id=response.json()['id'])
+        self.assertEqual(photo.derivatives_status, 'ready')
+
+        # Finalizing again returns the same photo
+        self.assertEqual(self.finalize(session).json()['id'], photo.id)
+        self.assertEqual(DriverLoadPhoto.objects.count(), 1)
+
+    def test_loads_sharing_a_load_number_get_their_own_blobs(self):
+        other = create_load(self.load.load_number)
+        first, second = make_jpeg(), make_jpeg()
+        sessions = [self.start(self.load, first), self.start(other, second)]
+        for session, data in zip(sessions, (first, second)):
+            self.put_chunks(session, data)
+            self.assertEqual(self.finalize(session).status_code, 201)
+
+        photos = [DriverLoadPhoto.objects.get(load=load) for load in (self.load, other)]
+        self.assertNotEqual(photos[0].image.name, photos[1].image.name)
+        self.assertNotEqual(photos[0].content_digest, photos[1].content_digest)
+
+    def test_finalize_retries_registration_after_commit(self):
+        data = make_jpeg()
+        session = self.start(self.load, data)
+        self.put_chunks(session, data)
+
+        with mock.patch('driver.views._register_load_photos', side_effect=RuntimeError('database unavailable')):
+            self.assertEqual(self.finalize(session).status_code, 500)
+        upload = ResumableUpload.objects.get(id=session['upload_id'])
+        self.assertEqual(upload.status, 'uploaded')
+        self.assertTrue(self.storage.exists(upload.blob_name))
+
+        response = self.finalize(session)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(DriverLoadPhoto.objects.get().image.name, upload.blob_name)
+
+    def test_cleanup_removes_abandoned_sessions(self):
+        data = make_jpeg()
+        sessions = [self.start(self.load, data) for _ in range(2)]
+        self.put_chunks(sessions[0], data, skip={0})
+        self.put_chunks(sessions[1], data)
+        with mock.patch('driver.views._register_load_photos', side_effect=RuntimeError('database unavailable')):
+            self.finalize(sessions[1])
+        committed_blob = ResumableUpload.objects.get(id=sessions[1]['upload_id']).blob_name
+
+        ResumableUpload.objects.update(updated_at=timezone.now() - timedelta(hours=settings.RESUMABLE_UPLOAD_TTL_HOURS + 1))
+        self.assertEqual(cleanup_resumable_uploads(), 2)
+        self.assertFalse(ResumableUpload.objects.exists())
+        self.assertFalse(self.storage.exists(committed_blob))
+
+
+# ----------------------------
+# Direct-to-blob upload session
+# ----------------------------
+class DirectUploadSessionTests(LocalStorageTestCase):
+    storage_class = SignedLocalBlobStorage
+
+    def create_session(self, load, files):
+        return self.client.post(reverse('create_upload_session_api', args=[load.id]), {'files': files}, format='json')
+
+    def test_non_numeric_size_is_rejected(self):
+        response = self.create_session(self.load, [{'photo_type': 'trailer', 'name': 'IMG_1.jpg', 'size': 'big'}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_commit_registers_uploaded_blobs(self):
+        files = [{'photo_type': 'trailer', 'name': f'IMG_{i}.jpg', 'size': 1000} for i in range(2)]
+        response = self.create_session(self.load, files)
+        self.assertEqual(response.status_code, 201)
+        session = response.json()
+
+        # The app PUTs only the first file
+        self.storage.save(session['uploads'][0]['blob_name'], ContentFile(make_jpeg()))
+
+        commit_url = reverse('commit_upload_session_api')
+        response = self.client.post(commit_url, {'session': session['session']}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['created']), 1)
+        self.assertEqual(response.json()['missing'], [1])
+
+        # Committing again does not register the first photo twice
+        self.client.post(commit_url, {'session': session['session']}, format='json')
+        self.assertEqual(DriverLoadPhoto.objects.count(), 1)
+        self.assertEqual(DriverLoadPhoto.objects.get().derivatives_status, 'ready')
+
+    def test_signed_names_are_unique_across_loads(self):
+        other = create_load(self.load.load_number)
+        files = [{'photo_type': 'trailer', 'name': 'IMG_1.jpg', 'size': 1000}]
+        names = [self.create_session(load, files).json()['uploads'][0]['blob_name'] for load in (self.load, other)]
+        self.assertNotEqual(names[0], names[1])
+
+    def test_retry_during_commit_does_not_register_twice(self):
+        session = self.create_session(self.load, [{'photo_type': 'trailer', 'name': 'IMG_1.jpg', 'size': 1000}]).json()
+        self.storage.save(session['uploads'][0]['blob_name'], ContentFile(make_jpeg()))
+        commit_url = reverse('commit_upload_session_api')
+
+        # The app retries while the first commit is still reading headers
+        check = views._check_stored_upload
+        retries = []
+
+        def check_then_retry(photo_type, name):
+            if not retries:
+                retries.append(None)
+                retries[0] = self.client.post(commit_url, {'session': session['session']}, format='json')
+            return check(photo_type, name)
+
+        with mock.patch('driver.views.ThreadPoolExecutor', InlineExecutor), \
+                mock.patch('driver.views._check_stored_upload', side_effect=check_then_retry):
+            response = self.client.post(commit_url, {'session': session['session']}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(retries[0].json()['created']), 1)
+        self.assertEqual(DriverLoadPhoto.objects.count(), 1)
+
+
+# ----------------------------
+# Duplicate uploads (content digest)
+# ----------------------------
+class DuplicateUploadTests(LocalStorageTestCase):
+
+    def upload(self, **files):
+        data = {'load_id': self.load.id}
+        data.update({key: SimpleUploadedFile(f'{key}.jpg', content, 'image/jpeg') for key, content in files.items()})
+        return self.client.post(reverse('save_upload_api'), data, format='multipart')
+
+    def test_resent_photo_is_stored_once(self):
+        data = make_jpeg()
+        self.assertEqual(self.upload(trailer_picture=data).status_code, 201)
+        self.assertEqual(self.upload(trailer_picture=data).status_code, 201)
+
+        self.assertEqual(DriverLoadPhoto.objects.filter(load=self.load).count(), 1)
+
+    def test_photo_moved_to_another_type_is_kept(self):
+        data = make_jpeg()
+        self.upload(sealed_trailer_picture=data)
+
+        response = self.client.post(reverse('update_upload_api', args=[self.load.id]), {
+            'trailer_picture': SimpleUploadedFile('IMG_1.jpg', data, 'image/jpeg'),
+            'sealed_trailer_picture_existing_ids': '',
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+
+        photo = DriverLoadPhoto.objects.get(load=self.load)
+        self.assertEqual(photo.photo_type, 'trailer')
+        self.assertTrue(self.storage.exists(photo.image.name))
+
+
+# ----------------------------
+# Upload budgets (PHOTO_UPLOAD_LIMITS)
+# ----------------------------
+@override_settings(PHOTO_UPLOAD_LIMITS={
+    'default': {'max_bytes': 2 * 1024 * 1024, 'max_pixels': 300_000, 'defer_pixels': 200_000, 'max_frames': 2},
+})
+class UploadBudgetTests(LocalStorageTestCase):
+
+    def upload(self, *files):
+        data = {'load_id': self.load.id, 'trailer_picture': [SimpleUploadedFile('IMG.jpg', f, 'image/jpeg') for f in files]}
+        return self.client.post(reverse('save_upload_api'), data, format='multipart')
+
+    def test_photo_within_budget_is_processed(self):
+        self.assertEqual(self.upload(make_jpeg(size=(400, 300))).status_code, 201)
+        self.assertEqual(DriverLoadPhoto.objects.get().derivatives_status, 'ready')
+
+    def test_photo_over_defer_pixels_is_left_to_the_backfill(self):
+        self.assertEqual(self.upload(make_jpeg(size=(500, 500))).status_code, 201)
+
+        photo = DriverLoadPhoto.objects.get()
+        self.assertEqual(photo.derivatives_status, 'deferred')
+        self.assertFalse(photo.resized_image)
+
+    def test_photo_over_max_pixels_rejects_the_whole_request(self):
+        response = self.upload(make_jpeg(size=(400, 300)), make_jpeg(size=(700, 500)))
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(DriverLoadPhoto.objects.exists())
+
+    @override_settings(PHOTO_UPLOAD_LIMITS={'default': {'max_bytes': 1000}})
+    def test_photo_over_max_bytes_is_rejected(self):
+        self.assertEqual(self.upload(make_jpeg(size=(400, 300))).status_code, 413)
+        self.assertFalse(DriverLoadPhoto.objects.exists())
+
+    def test_unreadable_file_is_rejected(self):
+        self.assertEqual(self.upload(b'not an image').status_code, 400)
+        self.assertFalse(DriverLoadPhoto.objects.exists())
+
+
+# ----------------------------
+# Bulk photo ingest
+# ----------------------------
+class BulkUploadTests(LocalStorageTestCase):
+
+    def bulk_upload(self, **fields):
+        data = {key: [SimpleUploadedFile(f'{key}_{i}.jpg', f, 'image/jpeg') for i, f in enumerate(files)]
+                for key, files in fields.items()}
+        return self.client.post(reverse('bulk_upload_photos_api', args=[self.load.id]), data, format='multipart')
+
+    def stored_originals(self):
+        _, names = self.storage.listdir('driver_uploads/trailer')
+        return names
+
+    def test_manifest_lists_created_photos_and_duplicates(self):
+        first, second = make_jpeg(), make_jpeg()
+        response = self.bulk_upload(trailer_picture=[first, second, first], pod_files=[make_jpeg()])
+        self.assertEqual(response.status_code, 201)
+
+        manifest = response.json()
+        self.assertEqual(sorted(entry['photo_type'] for entry in manifest['created']), ['POD', 'trailer', 'trailer'])
+        self.assertEqual(manifest['duplicates'], [{'field': 'trailer_picture', 'name': 'trailer_picture_2.jpg'}])
+        self.assertEqual(sorted(self.stored_originals()), ['LN1_trailer_1.jpg', 'LN1_trailer_2.jpg'])
+
+        # Sending the same photos again creates nothing
+        manifest = self.bulk_upload(trailer_picture=[first, second]).json()
+        self.assertEqual(manifest['created'], [])
+        self.assertEqual(len(manifest['duplicates']), 2)
+        self.assertEqual(DriverLoadPhoto.objects.count(), 3)
+
+    def test_failed_insert_removes_the_uploaded_blobs(self):
+        with mock.patch.object(DriverLoadPhoto.objects, 'bulk_create', side_effect=RuntimeError('database unavailable')):
+            response = self.bulk_upload(trailer_picture=[make_jpeg(), make_jpeg()])
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(DriverLoadPhoto.objects.exists())
+        self.assertEqual(self.stored_originals(), [])
+
+    def test_failed_blob_upload_removes_the_others(self):
+        save = self.storage._save
+
+        def fail_second(name, content):
+            if name.endswith('_2.jpg'):
+                raise OSError('connection reset')
+            return save(name, content)
+
+        with mock.patch.object(self.storage, '_save', side_effect=fail_second):
+            response = self.bulk_upload(trailer_picture=[make_jpeg(), make_jpeg()])
+
+        self.assertEqual(response.status_code, 502)
+        self.assertFalse(DriverLoadPhoto.objects.exists())
+        self.assertEqual(self.stored_originals(), [])
+
+
+# ----------------------------
+# Blob cleanup
+# ----------------------------
+class BlobCleanupTests(LocalStorageTestCase):
+
+    def create_photo(self):
+        return DriverLoadPhoto.objects.create(load=self.load, photo_type='trailer', image=ContentFile(make_jpeg(), name='IMG.jpg'))
+
+    def age(self, name, hours):
+        stamp = time.time() - hours * 3600
+        os.utime(self.storage.path(name), (stamp, stamp))
+
+    def test_deleting_a_photo_removes_all_its_blobs(self):
+        photo = DriverLoadPhoto.objects.get(id=self.create_photo().id)
+        names = photo.stored_names()
+        self.assertGreaterEqual(len(names), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+
+    def test_deleting_a_load_removes_its_photos_blobs(self):
+        photo = self.create_photo()
+        with self.captureOnCommitCallbacks(execute=True):
+            DriverLoadInfo.objects.filter(id=self.load.id).delete()
+        self.assertFalse(self.storage.exists(photo.image.name))
+
+    def test_sweep_deletes_only_old_unreferenced_blobs(self):
+        photo = self.create_photo()
+        old_orphan = self.storage.save('driver_uploads/trailer/LN9_trailer_1.jpg', ContentFile(b'x'))
+        new_orphan = self.storage.save('driver_uploads/trailer/LN9_trailer_2.jpg', ContentFile(b'x'))
+        for name in (photo.image.name, old_orphan):
+            self.age(name, settings.ORPHAN_SWEEP_MIN_AGE_HOURS + 1)
+
+        self.assertEqual(sweep_orphan_blobs(dry_run=True), 1)
+        self.assertTrue(self.storage.exists(old_orphan))
+
+        self.assertEqual(sweep_orphan_blobs(), 1)
+        self.assertFalse(self.storage.exists(old_orphan))
+        self.assertTrue(self.storage.exists(new_orphan))
+        self.assertTrue(self.storage.exists(photo.image.name))
+
+
+# ----------------------------
+# Generated load PDF cache
+# ----------------------------
+class LoadPdfCacheTests(LocalStorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.renders = 0
+        DriverLoadPhoto.objects.create(load=self.load, photo_type='trailer', image=ContentFile(make_jpeg(), name='IMG.jpg'))
+
+    def pdf(self, complete=True):
+        def render():
+            self.renders += 1
+            return io.BytesIO(f'%PDF render {self.renders}'.encode()), complete
+
+        load = DriverLoadInfo.objects.get(id=self.load.id)
+        with cached_load_pdf(load, list(load.photos.all()), render) as pdf:
+            return pdf.read()
+
+    def test_unchanged_load_is_served_from_the_cache(self):
+        first = self.pdf()
+        self.assertEqual(self.pdf(), first)
+        self.assertEqual(self.renders, 1)
+
+    def test_new_photo_invalidates_the_cached_copy(self):
+        self.pdf()
+        old_copy = DriverLoadInfo.objects.get(id=self.load.id).pdf_cache
+        DriverLoadPhoto.objects.create(load=self.load, photo_type='reefer', image=ContentFile(make_jpeg(), name='IMG.jpg'))
+
+        self.assertEqual(self.pdf(), b'%PDF render 2')
+        self.assertNotEqual(DriverLoadInfo.objects.get(id=self.load.id).pdf_cache, old_copy)
+        self.assertFalse(self.storage.exists(old_copy))
+
+    def test_load_field_change_invalidates_the_cached_copy(self):
+        self.pdf()
+        DriverLoadInfo.objects.filter(id=self.load.id).update(seal_number='S-123')
+        self.pdf()
+        self.assertEqual(self.renders, 2)
+
+    def test_email_bookkeeping_does_not_invalidate(self):
+        self.pdf()
+        DriverLoadInfo.objects.filter(id=self.load.id).update(email_thread_id='<thread@example.com>')
+        self.pdf()
+        self.assertEqual(self.renders, 1)
+
+    def test_incomplete_pdf_is_not_cached(self):
+        self.pdf(complete=False)
+        self.pdf()
+        self.assertEqual(self.renders, 2)
+
+
+# ----------------------------
+# Storage tiering of originals
+# ----------------------------
+class ArchivedOriginalTests(LocalStorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        photo = DriverLoadPhoto.objects.create(load=self.load, photo_type='trailer', image=ContentFile(make_jpeg(), name='IMG.jpg'))
+        DriverLoadPhoto.objects.filter(id=photo.id).update(original_tier='archive')
+        self.photo = DriverLoadPhoto.objects.get(id=photo.id)
+
+    def test_uploads_list_points_url_at_the_preview(self):
+        entry = self.client.get(reverse('get_uploads_api', args=[self.load.id])).json()['trailer'][0]
+
+        self.assertEqual(entry['url'], settings.MEDIA_URL + self.photo.resized_image.name)
+        self.assertFalse(entry['original_available'])
+        self.assertEqual(DriverLoadPhoto.objects.get(id=self.photo.id).original_tier, 'rehydrating')
+
+    def test_load_detail_points_url_at_the_preview(self):
+        entry = self.client.get(reverse('get_load_detail_api', args=[self.load.id])).json()['files']['trailer'][0]
+
+        self.assertEqual(entry['url'], self.storage.url(self.photo.resized_image.name))
+        self.assertEqual(DriverLoadPhoto.objects.get(id=self.photo.id).original_tier, 'rehydrating')
+
+    def test_url_is_the_original_once_back_online(self):
+        DriverLoadPhoto.objects.filter(id=self.photo.id).update(original_tier='hot')
+        entry = self.client.get(reverse('get_uploads_api', args=[self.load.id])).json()['trailer'][0]
+
+        self.assertEqual(entry['url'], settings.MEDIA_URL + self.photo.image.name)
@@ -18,6 +18,15 @@ urlpatterns = [
     path('driver/save-upload/', views.save_upload_api, name='save_upload_api'),
     path('driver/update-upload/<int:load_id>/', views.update_upload_api, name='update_upload_api'),
     path('driver/get-uploads/<int:load_id>/', views.get_uploads_api, name='get_uploads_api'),
+    path('driver/bulk-upload-photos/<int:load_id>/', views.bulk_upload_photos_api, name='bulk_upload_photos_api'),
+    path('driver/upload-session/<int:load_id>/', views.create_upload_session_api, name='create_upload_session_api'),
+    path('driver/upload-session/commit/', views.commit_upload_session_api, name='commit_upload_session_api'),
+
+    # Resumable chunked uploads
+    path('driver/resumable-upload/', views.create_resumable_upload_api, name='create_resumable_upload_api'),
+    path('driver/resumable-upload/<uuid:upload_id>/', views.get_resumable_upload_api, name='get_resumable_upload_api'),
+    path('driver/resumable-upload/<uuid:upload_id>/chunks/<int:index>/', views.put_resumable_chunk_api, name='put_resumable_chunk_api'),
+    path('driver/resumable-upload/<uuid:upload_id>/finalize/', views.finalize_resumable_upload_api, name='finalize_resumable_upload_api'),
 
     # Step 4: Delivery info
     path('driver/save-delivery-info/', views.save_delivery_info_api, name='save_delivery_info_api'),
@@ -1,16 +1,111 @@
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
-from PIL import Image
-from django.core.files.base import ContentFile
+from reportlab.lib.utils import ImageReader
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+import hashlib
 import re
 
+from backend.azure_storage import delete_storage_blobs, read_storage_bytes
+from .images import prefetch_images, prepare_pdf_image
+from .models import DriverLoadInfo, PHOTO_RENDITIONS
+
+
+def read_file_bytes(photo_file):
+    """
+    Read a stored file (original or rendition) fully. Returns None if it is
+    missing or the storage read fails, so one bad photo never aborts a batch.
+    """
+    if not photo_file:
+        return None
+    try:
+        return read_storage_bytes(photo_file.name, storage=photo_file.storage)
+    except Exception as e:
+        print(f"[DEBUG] Error reading {getattr(photo_file, 'name', 'unknown')}: {e}")
+        return None
+
+
+def pdf_spool():
+    """
+    Output file for a PDF renderer: kept in memory up to PDF_SPOOL_MAX_BYTES,
+    then moved to a temp file, so big loads don't hold the document in RAM.
+    """
+    return SpooledTemporaryFile(max_size=getattr(settings, 'PDF_SPOOL_MAX_BYTES', 8 * 1024 * 1024), mode='w+b')
+
+
+# ----------------------------
+# Generated load PDF cache
+# ----------------------------
+# Kept outside driver_uploads/ so sweep_orphan_blobs never sees them
+PDF_CACHE_PREFIX = "load_pdfs"
+# Bump when the PDF layout changes so every cached copy is rebuilt
+PDF_CACHE_VERSION = 1
+# Load fields that never appear in the PDF (written by the email flow)
+PDF_CACHE_IGNORED_FIELDS = {
+    'pickup_email_history', 'delivery_email_history', 'last_notification_sent',
+    'email_thread_id', 'pdf_cache',
+}
+
+
+def load_pdf_fingerprint(load, photos):
+    """
+    Hash of everything the load PDF is drawn from: updated_at and the other
+    load fields (some views save with update_fields, leaving updated_at
+    alone), the driver, and per photo its id, content digest, the renditions
+    available and whether the original is online.
+    """
+    parts = [f"v{PDF_CACHE_VERSION}", getattr(load.driver, 'name', ''), getattr(load.driver, 'company', '')]
+    parts += [
+        f"{field.attname}={field.value_from_object(load)}"
+        for field in load._meta.concrete_fields
+        if field.attname not in PDF_CACHE_IGNORED_FIELDS
+    ]
+    for photo in sorted(photos, key=lambda photo: photo.pk):
+        renditions = ",".join(getattr(photo, r['field']).name for r in PHOTO_RENDITIONS if getattr(photo, r['field']))
+        parts.append(f"{photo.pk}:{photo.photo_type}:{photo.content_digest or photo.image.name}:{renditions}:{photo.original_online}")
+    return hashlib.sha256("|".join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def cached_load_pdf(load, photos, render):
+    """
+    The load PDF as an open file, served from storage when nothing it is
+    drawn from changed since it was last built. Otherwise render() is called
+    and must return (buffer, complete). The result is stored under a new
+    fingerprint (replacing the previous copy) only when complete, so a PDF
+    missing a page image is never reused.
+    """
+    name = f"{PDF_CACHE_PREFIX}/{load.pk}/{load_pdf_fingerprint(load, photos)}.pdf"
+    if load.pdf_cache == name:
+        try:
+            return default_storage.open(name, 'rb')
+        except Exception as e:
+            print(f"[DEBUG] Cached PDF {name} unreadable, rebuilding: {e}")
+
+    buffer, complete = render()
+    if complete:
+        try:
+            buffer.seek(0)
+            stored = default_storage.save(name, File(buffer, name=name))
+            # queryset update: leaves updated_at (part of the fingerprint) alone
+            DriverLoadInfo.objects.filter(pk=load.pk).update(pdf_cache=stored)
+            if load.pdf_cache and load.pdf_cache != stored:
+                delete_storage_blobs([load.pdf_cache])
+            load.pdf_cache = stored
+        except Exception as e:
+            print(f"[DEBUG] Error caching PDF for load {load.pk}: {e}")
+    buffer.seek(0)
+    return buffer
+
 def generate_load_pdf(load, include_pod=True, max_image_width=1200, max_image_height=1600, jpeg_quality=70):
     """
     Generate an optimized PDF containing all photos (and optionally PODs) of a DriverLoadInfo.
     Images are resized and compressed to reduce PDF size.
+    Returns a File over the spooled output (no extra copy); close it when done.
     """
-    buffer = BytesIO()
+    buffer = pdf_spool()
     c = canvas.Canvas(buffer, pagesize=A4)
     page_width, page_height = A4
 
@@ -18,27 +113,24 @@ def generate_load_pdf(load, include_pod=True, max_image_width=1200, max_image_he
     if not include_pod:
         photos = photos.exclude(photo_type='POD')
 
-    if not photos.exists():
+    photos = list(photos)
+    if not photos:
         print(f"[DEBUG] No photos found for load {load.load_number} (include_pod={include_pod})")
 
-    for idx, photo in enumerate(photos, start=1):
+    # Fetch the smallest rendition that covers the target box (print-size JPEG when ready)
+    # and resize + compress the pages concurrently on the shared image pool
+    max_size = (max_image_width, max_image_height)
+    photo_files = [photo.best_rendition(*max_size) for photo in photos]
+    prepared = prefetch_images(prepare_pdf_image, read_file_bytes, photo_files, (max_size, jpeg_quality))
+
+    for idx, (photo, page_image) in enumerate(zip(photos, prepared), start=1):
         try:
             print(f"[DEBUG] Processing photo {idx}: {photo.photo_type}")
 
-            # Open image safely from any storage backend
-            photo.image.open()
-            img = Image.open(photo.image)
-            img = img.convert("RGB")  # Ensure PDF compatibility
+            if page_image is None:
+                raise ValueError("image could not be read or decoded")
+            img_bytes, (img_width, img_height) = page_image
 
-            # Resize if too large
-            img.thumbnail((max_image_width, max_image_height), Image.LANCZOS)
-
-            # Save compressed version to BytesIO
-            img_buffer = BytesIO()
-            img.save(img_buffer, format="JPEG", quality=jpeg_quality)
-            img_buffer.seek(0)
-
-            img_width, img_height = img.size
             scale = min(page_width / img_width, page_height / img_height) * 0.95
             img_width_scaled = img_width * scale
             img_height_scaled = img_height * scale
@@ -46,11 +138,8 @@ def generate_load_pdf(load, include_pod=True, max_image_width=1200, max_image_he
             y = (page_height - img_height_scaled) / 2
 
             # Draw image onto PDF
-            c.drawInlineImage(img_buffer, x, y, img_width_scaled, img_height_scaled)
+            c.drawImage(ImageReader(BytesIO(img_bytes)), x, y, img_width_scaled, img_height_scaled)
             c.showPage()
-
-            img.close()
-            photo.image.close()
         except Exception as e:
             print(f"[DEBUG] Error adding photo {getattr(photo.image, 'name', 'unknown')}: {e}")
 
@@ -58,6 +147,6 @@ def generate_load_pdf(load, include_pod=True, max_image_width=1200, max_image_he
     buffer.seek(0)
 
     safe_load_number = re.sub(r'[^\w\-]', '_', load.load_number or "load")
-    pdf_file = ContentFile(buffer.read(), name=f"{safe_load_number}_all_photos.pdf")
+    pdf_file = File(buffer, name=f"{safe_load_number}_all_photos.pdf")
     print(f"[DEBUG] PDF generated successfully: {pdf_file.name}, size: {pdf_file.size} bytes")
     return pdf_file
@@ -2,16 +2,21 @@
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
 from django.core.mail import EmailMessage
+from django.db import transaction
 from django.template.loader import render_to_string
 
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 
 import json
 import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
 
@@ -21,15 +26,36 @@ from .models import (
     DriverLocation,
     Customer,
     DriverLoadPhoto,
-    Company
+    Company,
+    ResumableUpload,
+    allocate_photo_sequences,
+    file_digest,
+    load_photo_name,
+    reserve_photo_name
 )
 
 from django.utils import timezone
 import pytz
 from email.utils import make_msgid
+import io
+import os
 import uuid
 import traceback
 
+from backend.azure_storage import read_storage_bytes
+from backend.storage_metrics import bind_storage_io, storage_io
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobBlock, ContentSettings
+from backend.upload_handlers import (
+    HEADER_PREFIX_BYTES,
+    BlobStagingMultiPartParser,
+    StagedBlobUpload,
+    make_block_id,
+    supports_block_staging,
+)
+from .images import PhotoRejected, check_photo_budget, inspect_image_header, photo_upload_limits
+from .tasks import queue_photo_derivatives
+
 
 
 
@@ -269,10 +295,146 @@ def get_equipment_types_api(request):
     ]
     return JsonResponse({"equipment_types": equipment_types}, status=200)
 
+# ----------------------------
+# HELPER: image format negotiation
+# ----------------------------
+# Server preference for app-facing renditions; JPEG is always the fallback
+IMAGE_FORMAT_PREFERENCE = ['avif', 'webp']
+
+def _accepted_image_formats(request):
+    """
+    Formats the app can decode, from an Accept-style `image_accept` parameter,
+    e.g. ?image_accept=image/avif,image/webp (DRF reserves `accept` for renderers).
+    Returned in server preference order.
+    """
+    accept = request.query_params.get("image_accept") or request.data.get("image_accept") or ""
+    advertised = {
+        part.split(";")[0].strip().lower().replace("image/", "")
+        for part in accept.split(",")
+    }
+    return [fmt for fmt in IMAGE_FORMAT_PREFERENCE if fmt in advertised]
+
+# ----------------------------
+# HELPER: single photo entry (original + derivative state)
+# ----------------------------
+def _photo_url_name(photo):
+    """
+    Blob behind a photo's "url" (the only field the app reads): the original,
+    or the JPEG preview while the original is archived. The rehydration is
+    queued then, so the original comes back on a later request.
+    """
+    if photo.request_original():
+        return photo.image.name
+    return photo.rendition_name("preview") or photo.image.name
+
+
+def _photo_entry(photo, image_formats=()):
+    thumbnail_name = photo.rendition_name("thumb", image_formats)
+    resized_name = photo.rendition_name("preview", image_formats)
+    return {
+        "id": photo.id,
+        "url": settings.MEDIA_URL + _photo_url_name(photo),
+        "thumbnail_url": settings.MEDIA_URL + thumbnail_name if thumbnail_name else "",
+        "resized_url": settings.MEDIA_URL + resized_name if resized_name else "",
+        "derivatives_ready": photo.derivatives_ready,
+        # False while the full-size original is archived; renditions are always readable
+        "original_available": photo.original_online,
+    }
+
+# ----------------------------
+# HELPER: pixel / byte budget for uploads (header only, nothing decoded)
+# ----------------------------
+PICKUP_PHOTO_FIELDS = {
+    "trailer_picture": "trailer",
+    "pulp_picture": "pulp",
+    "reefer_picture": "reefer",
+    "load_secure_picture": "load_secure",
+    "sealed_trailer_picture": "sealed_trailer",
+    "bol_picture": "bol",
+}
+
+
+def _check_prefix_budget(photo_type, prefix, size):
+    """Budget check from the first HEADER_PREFIX_BYTES of a file already in storage."""
+    try:
+        header = inspect_image_header(io.BytesIO(prefix))
+    except PhotoRejected:
+        if len(prefix) < HEADER_PREFIX_BYTES:
+            raise
+        # Header not within the prefix (huge EXIF block): let the worker look later
+        return 'defer'
+    return check_photo_budget(header, size, photo_type)
+
+
+def _check_upload_budget(photo_type, uploaded_file):
+    """
+    Inspect the image header of one upload against PHOTO_UPLOAD_LIMITS.
+    Returns 'ok' or 'defer'; raises PhotoRejected for files over the hard limits.
+    """
+    if isinstance(uploaded_file, StagedBlobUpload):
+        return _check_prefix_budget(photo_type, uploaded_file.header_prefix, uploaded_file.size)
+
+    header = inspect_image_header(uploaded_file)
+    uploaded_file.seek(0)
+    return check_photo_budget(header, uploaded_file.size, photo_type)
+
+
+def _check_upload_budgets(request, fields):
+    """
+    Check every uploaded file in `fields` ({form key: photo_type}) before
+    anything is saved, so one oversized photo rejects the whole request.
+    Marks each file with .defer_derivatives for _save_load_photo.
+    """
+    for key, photo_type in fields.items():
+        for uploaded_file in request.FILES.getlist(key):
+            uploaded_file.defer_derivatives = _check_upload_budget(photo_type, uploaded_file) == 'defer'
+
+
+# ----------------------------
+# HELPER: store one uploaded photo, skipping identical re-uploads
+# ----------------------------
+def _save_load_photo(load_info, photo_type, uploaded_file):
+    """
+    Create a DriverLoadPhoto unless this load already has a photo of this
+    type with the same bytes (mobile retries resend the same file, often
+    under a new name). Returns the new photo, or None for a duplicate (no
+    blob write, no resize). Scoped to the type because update_upload_api
+    replaces one type at a time: a photo moved to another type is not a
+    duplicate of the row about to be deleted.
+
+    Files streamed by BlobStagingUploadHandler arrive as staged Azure blocks with
+    their digest already computed; the block list is committed and the blob
+    moved (server-side) to its LOAD_type_N name.
+    """
+    if isinstance(uploaded_file, StagedBlobUpload):
+        digest = uploaded_file.content_digest
+    else:
+        digest = file_digest(uploaded_file)
+
+    if DriverLoadPhoto.objects.filter(load=load_info, photo_type=photo_type, content_digest=digest).exists():
+        return None
+
+    if isinstance(uploaded_file, StagedBlobUpload):
+        ext = os.path.splitext(uploaded_file.name)[1].lstrip('.').lower() or 'jpg'
+        image = uploaded_file.commit(reserve_photo_name(load_info, photo_type, ext))  # blob name, already in storage
+    else:
+        image = uploaded_file
+
+    # Over the defer_pixels budget: no derivative job now, the periodic backfill builds them
+    deferred = getattr(uploaded_file, 'defer_derivatives', False)
+
+    return DriverLoadPhoto.objects.create(
+        load=load_info,
+        photo_type=photo_type,
+        image=image,
+        content_digest=digest,
+        derivatives_status='deferred' if deferred else 'pending'
+    )
+
 # ----------------------------
 # HELPER: build file response
 # ----------------------------
-def _build_file_response(load_info):
+def _build_file_response(load_info, image_formats=()):
     photos = DriverLoadPhoto.objects.filter(load=load_info)
     file_map = {
         "trailer": [],
@@ -291,10 +453,7 @@ def _build_file_response(load_info):
     for photo in photos:
         key = photo.photo_type.lower().replace(" ", "_")
         if key in file_map:
-            file_map[key].append({
-                "id": photo.id,
-                "url": settings.MEDIA_URL + str(photo.image)
-            })
+            file_map[key].append(_photo_entry(photo, image_formats))
 
     response = {
         "load_id": load_info.id,
@@ -320,6 +479,7 @@ def _build_file_response(load_info):
 # UPLOAD FILES (STEP 3) - PICKUP
 # ----------------------------
 @api_view(['POST', 'PUT'])
+@parser_classes([JSONParser, FormParser, BlobStagingMultiPartParser])
 def save_upload_api(request):
     load_id = request.data.get("load_id")
     if not load_id:
@@ -329,6 +489,11 @@ def save_upload_api(request):
     if not load_info:
         return Response({"error": "Load info not found"}, status=404)
 
+    try:
+        _check_upload_budgets(request, PICKUP_PHOTO_FIELDS)
+    except PhotoRejected as e:
+        return Response({"error": str(e)}, status=e.status)
+
     # Save pickup notes
     pickup_notes = request.data.get("pickup_notes", "").strip()
     if pickup_notes:
@@ -358,26 +523,13 @@ def save_upload_api(request):
     load_info.save()
 
     # Save uploaded photos
-    file_map = {
-        "trailer_picture": "trailer",
-        "pulp_picture": "pulp",
-        "reefer_picture": "reefer",
-        "load_secure_picture": "load_secure",
-        "sealed_trailer_picture": "sealed_trailer",
-        "bol_picture": "bol",
-    }
-
-    for key, photo_type in file_map.items():
+    for key, photo_type in PICKUP_PHOTO_FIELDS.items():
         uploaded_files = request.FILES.getlist(key)
         for uploaded_file in uploaded_files:
-            DriverLoadPhoto.objects.create(
-                load=load_info,
-                photo_type=photo_type,
-                image=uploaded_file
-            )
+            _save_load_photo(load_info, photo_type, uploaded_file)
 
     return Response(
-        {"message": "Step 3 data saved successfully", "data": _build_file_response(load_info)},
+        {"message": "Step 3 data saved successfully", "data": _build_file_response(load_info, _accepted_image_formats(request))},
         status=201
     )
 
@@ -386,11 +538,17 @@ def save_upload_api(request):
 # UPDATE FILES (STEP 3)
 # ----------------------------
 @api_view(['POST', 'PUT'])
+@parser_classes([JSONParser, FormParser, BlobStagingMultiPartParser])
 def update_upload_api(request, load_id):
     load_info = DriverLoadInfo.objects.filter(id=load_id).first()
     if not load_info:
         return Response({"error": "Load info not found"}, status=404)
 
+    try:
+        _check_upload_budgets(request, PICKUP_PHOTO_FIELDS)
+    except PhotoRejected as e:
+        return Response({"error": str(e)}, status=e.status)
+
     # ----------------------------
     # Update text fields
     # ----------------------------
@@ -408,16 +566,7 @@ def update_upload_api(request, load_id):
     # ----------------------------
     # Update uploaded photos
     # ----------------------------
-    file_map = {
-        "trailer_picture": "trailer",
-        "pulp_picture": "pulp",
-        "reefer_picture": "reefer",
-        "load_secure_picture": "load_secure",
-        "sealed_trailer_picture": "sealed_trailer",
-        "bol_picture": "bol",
-    }
-
-    for key, photo_type in file_map.items():
+    for key, photo_type in PICKUP_PHOTO_FIELDS.items():
         # 1️⃣ Get existing IDs from frontend (if any)
         existing_ids_str = request.data.get(f"{key}_existing_ids", "")
         existing_ids_list = [int(x) for x in existing_ids_str.split(",") if x.isdigit()]
@@ -426,24 +575,13 @@ def update_upload_api(request, load_id):
         DriverLoadPhoto.objects.filter(load=load_info, photo_type=photo_type)\
             .exclude(id__in=existing_ids_list).delete()
 
-        # 3️⃣ Save new uploaded files, avoiding duplicates
+        # 3️⃣ Save new uploaded files, skipping identical bytes (content digest)
         uploaded_files = request.FILES.getlist(key)
         for uploaded_file in uploaded_files:
-            duplicate_exists = DriverLoadPhoto.objects.filter(
-                load=load_info,
-                photo_type=photo_type,
-                image__icontains=uploaded_file.name
-            ).exists()
-
-            if not duplicate_exists:
-                DriverLoadPhoto.objects.create(
-                    load=load_info,
-                    photo_type=photo_type,
-                    image=uploaded_file
-                )
+            _save_load_photo(load_info, photo_type, uploaded_file)
 
     return Response(
-        {"message": "Step 3 data updated successfully", "data": _build_file_response(load_info)},
+        {"message": "Step 3 data updated successfully", "data": _build_file_response(load_info, _accepted_image_formats(request))},
         status=200
     )
 
@@ -457,14 +595,453 @@ def get_uploads_api(request, load_id):
     if not load_info:
         return Response({"error": "Load info not found"}, status=404)
 
-    response_data = _build_file_response(load_info)
+    response_data = _build_file_response(load_info, _accepted_image_formats(request))
     return Response(response_data, status=200)
 
 # ----------------------------
-# DELIVERY INFO (STEP 4)
+# HELPER: insert many photos at once
+# ----------------------------
+def _register_load_photos(photos, discard_on_failure=True):
+    """
+    Insert unsaved DriverLoadPhoto rows (blobs already stored) with one
+    bulk_create in one transaction, then queue their derivatives, which
+    bulk_create would otherwise skip with save(). On failure the blobs are
+    deleted (unless discard_on_failure is False, for callers that retry with
+    the same blob) so nothing is orphaned and the error is re-raised.
+    """
+    try:
+        with transaction.atomic():
+            created = DriverLoadPhoto.objects.bulk_create(photos)
+    except Exception:
+        if discard_on_failure:
+            for photo in photos:
+                default_storage.delete(photo.image.name)
+        raise
+
+    for photo in created:
+        if photo.derivatives_status != 'deferred':
+            queue_photo_derivatives(photo)
+    return created
+
 # ----------------------------
+# BULK PHOTO INGEST
+# ----------------------------
+BULK_PHOTO_FIELDS = {**PICKUP_PHOTO_FIELDS, "pod_files": "POD"}
+
+
 @api_view(['POST'])
 @parser_classes([MultiPartParser, FormParser])
+def bulk_upload_photos_api(request, load_id):
+    """
+    Ingest all photos for a load in one request (same form keys as steps 3/4).
+    Blobs are uploaded concurrently, sequence numbers are reserved once per
+    photo type and the rows go in with a single bulk_create in one transaction.
+    Returns a manifest of the created photos and the skipped duplicates.
+    """
+    load_info = DriverLoadInfo.objects.filter(id=load_id).first()
+    if not load_info:
+        return Response({"error": "Load info not found"}, status=404)
+
+    try:
+        _check_upload_budgets(request, BULK_PHOTO_FIELDS)
+    except PhotoRejected as e:
+        return Response({"error": str(e)}, status=e.status)
+
+    # Skip files already on the load or repeated within this request, per photo type
+    seen = set(
+        DriverLoadPhoto.objects.filter(load=load_info)
+        .exclude(content_digest=None)
+        .values_list('photo_type', 'content_digest')
+    )
+    uploads = []
+    duplicates = []
+    for key, photo_type in BULK_PHOTO_FIELDS.items():
+        for uploaded_file in request.FILES.getlist(key):
+            digest = file_digest(uploaded_file)
+            if (photo_type, digest) in seen:
+                duplicates.append({"field": key, "name": uploaded_file.name})
+                continue
+            seen.add((photo_type, digest))
+            uploads.append((photo_type, uploaded_file, digest))
+
+    if not uploads:
+        return Response({"created": [], "duplicates": duplicates}, status=200)
+
+    # Reserve every sequence number up front and name the blobs
+    next_sequence = allocate_photo_sequences(load_info, Counter(photo_type for photo_type, _, _ in uploads))
+    names = []
+    for photo_type, uploaded_file, _ in uploads:
+        ext = uploaded_file.name.split('.')[-1]
+        names.append(load_photo_name(load_info.load_number, photo_type, next_sequence[photo_type], ext))
+        next_sequence[photo_type] += 1
+
+    # Upload blobs concurrently
+    with ThreadPoolExecutor(max_workers=settings.BULK_UPLOAD_WORKERS) as pool:
+        futures = [
+            pool.submit(bind_storage_io(default_storage.save), name, uploaded_file)
+            for name, (_, uploaded_file, _) in zip(names, uploads)
+        ]
+    stored = []
+    failed = False
+    for future in futures:
+        try:
+            stored.append(future.result())
+        except Exception as e:
+            print(f"Error uploading photo for load {load_id}: {e}")
+            failed = True
+    if failed:
+        for name in stored:
+            default_storage.delete(name)
+        return Response({"error": "Photos could not be uploaded, please retry"}, status=502)
+
+    photos = [
+        DriverLoadPhoto(
+            load=load_info,
+            photo_type=photo_type,
+            image=name,
+            content_digest=digest,
+            derivatives_status='deferred' if getattr(uploaded_file, 'defer_derivatives', False) else 'pending',
+        )
+        for name, (photo_type, uploaded_file, digest) in zip(stored, uploads)
+    ]
+    try:
+        photos = _register_load_photos(photos)
+    except Exception as e:
+        print(f"Error saving photos for load {load_id}: {e}")
+        return Response({"error": "Photos could not be saved, please retry"}, status=500)
+
+    image_formats = _accepted_image_formats(request)
+    created = [dict(_photo_entry(photo, image_formats), photo_type=photo.photo_type) for photo in photos]
+    return Response({"created": created, "duplicates": duplicates}, status=201)
+
+# ----------------------------
+# DIRECT-TO-BLOB UPLOAD SESSION
+# ----------------------------
+UPLOAD_SESSION_SALT = "driver.upload_session"
+PHOTO_TYPES = {value for value, _ in DriverLoadPhoto._meta.get_field('photo_type').choices}
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser])
+def create_upload_session_api(request, load_id):
+    """
+    Start a direct upload for N photos on a load. Names are reserved up front
+    and each photo gets a short-lived signed URL; the app PUTs the files
+    straight to blob storage, then calls commit_upload_session_api.
+    Body: {"files": [{"photo_type": "trailer", "name": "IMG_1.jpg", "size": 123, "content_type": "image/jpeg"}]}
+    """
+    load_info = DriverLoadInfo.objects.filter(id=load_id).first()
+    if not load_info:
+        return Response({"error": "Load info not found"}, status=404)
+
+    if not hasattr(default_storage, 'upload_url'):
+        return Response({"error": "Direct uploads are not available on this storage"}, status=400)
+
+    files = request.data.get("files") or []
+    if not files:
+        return Response({"error": "files is required"}, status=400)
+    for f in files:
+        photo_type = f.get("photo_type")
+        if photo_type not in PHOTO_TYPES:
+            return Response({"error": f"Unknown photo_type: {photo_type}"}, status=400)
+        try:
+            size = int(f.get("size") or 0)
+        except (TypeError, ValueError):
+            return Response({"error": f"Invalid size for {f.get('name')}"}, status=400)
+        max_bytes = photo_upload_limits(photo_type).get('max_bytes')
+        if max_bytes and size > max_bytes:
+            return Response({"error": f"{f.get('name')} is over the {max_bytes} byte limit for {photo_type}"}, status=413)
+
+    next_sequence = allocate_photo_sequences(load_info, Counter(f["photo_type"] for f in files))
+    expire = settings.DIRECT_UPLOAD_EXPIRATION_SECS
+    blobs = []
+    uploads = []
+    for index, f in enumerate(files):
+        photo_type = f["photo_type"]
+        ext = os.path.splitext(f.get("name") or "")[1].lstrip('.').lower() or "jpg"
+        # The signed URL can write this name, so it must never be another photo's blob
+        name = load_photo_name(load_info.load_number, photo_type, next_sequence[photo_type], ext, unique=True)
+        next_sequence[photo_type] += 1
+
+        blobs.append([photo_type, name])
+        uploads.append({
+            "index": index,
+            "blob_name": name,
+            "upload_url": default_storage.upload_url(name, expire),
+            "method": "PUT",
+            "headers": {
+                "x-ms-blob-type": "BlockBlob",
+                "x-ms-blob-content-type": f.get("content_type") or "image/jpeg",
+                "If-None-Match": "*",  # a resent PUT after success fails instead of rewriting
+            },
+        })
+
+    session = signing.dumps({"load": load_info.id, "blobs": blobs}, salt=UPLOAD_SESSION_SALT)
+    return Response({"session": session, "expires_in": expire, "uploads": uploads}, status=201)
+
+
+def _check_stored_upload(photo_type, name):
+    """Budget check for a blob the app uploaded directly; reads only its header prefix."""
+    size = default_storage.size(name)
+    return _check_prefix_budget(photo_type, read_storage_bytes(name, HEADER_PREFIX_BYTES), size)
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser])
+def commit_upload_session_api(request):
+    """
+    Register the photos uploaded through create_upload_session_api.
+    Body: {"session": "<token>", "uploaded": [0, 1, ...]} (indices, default all).
+    Only the header of each blob is read here; derivatives are queued as usual.
+    Indices whose blob is not in storage come back under "missing" and can be
+    committed again once uploaded. Safe to repeat, also concurrently (a retry
+    sent while the first call is still running): inserts are serialized on
+    the load row.
+    """
+    try:
+        session = signing.loads(
+            request.data.get("session") or "",
+            salt=UPLOAD_SESSION_SALT,
+            max_age=settings.DIRECT_UPLOAD_EXPIRATION_SECS + 3600,
+        )
+    except signing.BadSignature:
+        return Response({"error": "Upload session is invalid or expired"}, status=400)
+
+    load_info = DriverLoadInfo.objects.filter(id=session["load"]).first()
+    if not load_info:
+        return Response({"error": "Load info not found"}, status=404)
+
+    blobs = session["blobs"]
+    indices = request.data.get("uploaded")
+    if indices is None:
+        indices = range(len(blobs))
+    indices = sorted({int(i) for i in indices if str(i).isdigit() and int(i) < len(blobs)})
+
+    # Already committed by an earlier call (checked again under the lock below)
+    registered = set(
+        DriverLoadPhoto.objects.filter(load=load_info, image__in=[blobs[i][1] for i in indices])
+        .values_list('image', flat=True)
+    )
+    pending = [i for i in indices if blobs[i][1] not in registered]
+
+    with ThreadPoolExecutor(max_workers=settings.BULK_UPLOAD_WORKERS) as pool:
+        checks = {i: pool.submit(bind_storage_io(_check_stored_upload), *blobs[i]) for i in pending}
+
+    photos = []
+    missing = []
+    rejected = []
+    for i, future in checks.items():
+        photo_type, name = blobs[i]
+        try:
+            budget = future.result()
+        except PhotoRejected as e:
+            default_storage.delete(name)
+            rejected.append({"index": i, "error": str(e)})
+            continue
+        except Exception:
+            missing.append(i)
+            continue
+        photos.append(DriverLoadPhoto(
+            load=load_info,
+            photo_type=photo_type,
+            image=name,
+            derivatives_status='deferred' if budget == 'defer' else 'pending',
+        ))
+
+    try:
+        with transaction.atomic():
+            DriverLoadInfo.objects.select_for_update().filter(id=load_info.id).first()
+            registered = set(
+                DriverLoadPhoto.objects.filter(load=load_info, image__in=[photo.image.name for photo in photos])
+                .values_list('image', flat=True)
+            )
+            photos = _register_load_photos([photo for photo in photos if photo.image.name not in registered])
+    except Exception as e:
+        print(f"Error registering direct uploads for load {load_info.id}: {e}")
+        return Response({"error": "Photos could not be saved, please retry"}, status=500)
+
+    image_formats = _accepted_image_formats(request)
+    created = [dict(_photo_entry(photo, image_formats), photo_type=photo.photo_type) for photo in photos]
+    return Response({"created": created, "missing": missing, "rejected": rejected}, status=201)
+
+# ----------------------------
+# RESUMABLE CHUNKED UPLOAD
+# ----------------------------
+def _resumable_received(upload):
+    """Indices of the chunks already staged for this upload."""
+    blob_client = default_storage.client.get_blob_client(upload.blob_name)
+    try:
+        with storage_io("get_block_list"):
+            _, uncommitted = blob_client.get_block_list('uncommitted')
+    except ResourceNotFoundError:
+        return []  # no block staged yet: storage has no blob under that name
+    block_indices = {make_block_id(index): index for index in range(upload.chunk_count)}
+    return sorted({block_indices[block.id] for block in uncommitted if block.id in block_indices})
+
+
+def _resumable_status(upload):
+    if upload.status != 'open':
+        received = list(range(upload.chunk_count))
+    else:
+        received = _resumable_received(upload)
+    return {
+        "upload_id": str(upload.id),
+        "status": upload.status,
+        "chunk_size": upload.chunk_size,
+        "chunk_count": upload.chunk_count,
+        "received": received,
+        "missing": [i for i in range(upload.chunk_count) if i not in received],
+        "photo_id": upload.photo_id,
+    }
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser])
+def create_resumable_upload_api(request):
+    """
+    Start a resumable upload of one photo.
+    Body: {"load_id": 1, "photo_type": "trailer", "name": "IMG_1.jpg", "size": 5242880, "content_type": "image/jpeg"}
+    The app then PUTs each chunk (chunk_size bytes, numbered from 0), can ask
+    which chunks arrived after a dropped connection, and finalizes.
+    """
+    load_info = DriverLoadInfo.objects.filter(id=request.data.get("load_id")).first()
+    if not load_info:
+        return Response({"error": "Load info not found"}, status=404)
+
+    if not supports_block_staging(default_storage):
+        return Response({"error": "Resumable uploads are not available on this storage"}, status=400)
+
+    photo_type = request.data.get("photo_type")
+    if photo_type not in PHOTO_TYPES:
+        return Response({"error": f"Unknown photo_type: {photo_type}"}, status=400)
+    try:
+        size = int(request.data.get("size"))
+    except (TypeError, ValueError):
+        return Response({"error": "size is required"}, status=400)
+    max_bytes = photo_upload_limits(photo_type).get('max_bytes')
+    if size <= 0 or (max_bytes and size > max_bytes):
+        return Response({"error": f"size must be between 1 and {max_bytes} bytes for {photo_type}"}, status=413)
+
+    file_name = request.data.get("name") or "photo.jpg"
+    ext = os.path.splitext(file_name)[1].lstrip('.').lower() or "jpg"
+
+    upload = ResumableUpload.objects.create(
+        load=load_info,
+        photo_type=photo_type,
+        file_name=file_name,
+        content_type=request.data.get("content_type") or "image/jpeg",
+        total_size=size,
+        chunk_size=settings.RESUMABLE_CHUNK_SIZE,
+        blob_name=reserve_photo_name(load_info, photo_type, ext),
+    )
+    return Response(_resumable_status(upload), status=201)
+
+
+@api_view(['GET'])
+def get_resumable_upload_api(request, upload_id):
+    """Which chunks the server has; the app resends only `missing`."""
+    upload = ResumableUpload.objects.filter(id=upload_id).first()
+    if not upload:
+        return Response({"error": "Upload not found"}, status=404)
+    return Response(_resumable_status(upload), status=200)
+
+
+@api_view(['PUT'])
+def put_resumable_chunk_api(request, upload_id, index):
+    """
+    Store chunk `index` (raw request body) as a staged block. Re-sending a
+    chunk just replaces it, so retries are always safe.
+    """
+    upload = ResumableUpload.objects.filter(id=upload_id, status='open').first()
+    if not upload:
+        return Response({"error": "Upload not found or already finalized"}, status=404)
+    if index >= upload.chunk_count:
+        return Response({"error": f"Chunk index must be below {upload.chunk_count}"}, status=400)
+
+    data = request.body
+    if len(data) != upload.chunk_length(index):
+        return Response({"error": f"Chunk {index} must be {upload.chunk_length(index)} bytes, got {len(data)}"}, status=400)
+
+    blob_client = default_storage.client.get_blob_client(upload.blob_name)
+    with storage_io("stage_block", len(data)):
+        blob_client.stage_block(make_block_id(index), data, length=len(data))
+
+    # Keeps the session alive for the cleanup task
+    ResumableUpload.objects.filter(id=upload.id).update(updated_at=timezone.now())
+    return Response({"received": index}, status=200)
+
+
+def _register_resumable_upload(upload):
+    """Budget-check the committed blob and create its photo; an error Response or None."""
+    try:
+        budget = _check_stored_upload(upload.photo_type, upload.blob_name)
+    except PhotoRejected as e:
+        default_storage.delete(upload.blob_name)
+        upload.delete()
+        return Response({"error": str(e)}, status=e.status)
+
+    try:
+        photo = _register_load_photos([DriverLoadPhoto(
+            load=upload.load,
+            photo_type=upload.photo_type,
+            image=upload.blob_name,
+            derivatives_status='deferred' if budget == 'defer' else 'pending',
+        )], discard_on_failure=False)[0]
+    except Exception as e:
+        print(f"Error registering resumable upload {upload.id}: {e}")
+        return Response({"error": "Photo could not be saved, please retry"}, status=500)
+
+    upload.status = 'committed'
+    upload.photo = photo
+    upload.save(update_fields=['status', 'photo', 'updated_at'])
+    return None
+
+
+@api_view(['POST'])
+def finalize_resumable_upload_api(request, upload_id):
+    """
+    Commit the chunks in order and register the DriverLoadPhoto (derivatives
+    queued as usual). Answers 409 with the missing chunks if any are absent.
+    Calling it again after success returns the same photo.
+    """
+    upload = ResumableUpload.objects.filter(id=upload_id).first()
+    if not upload:
+        return Response({"error": "Upload not found"}, status=404)
+
+    if upload.status == 'open':
+        status_data = _resumable_status(upload)
+        if status_data["missing"]:
+            return Response(status_data, status=409)
+
+        blob_client = default_storage.client.get_blob_client(upload.blob_name)
+        with storage_io("commit_blocks"):
+            blob_client.commit_block_list(
+                [BlobBlock(block_id=make_block_id(index)) for index in range(upload.chunk_count)],
+                content_settings=ContentSettings(content_type=upload.content_type),
+            )
+        # Recorded so a retry after a failure below skips straight to registering
+        upload.status = 'uploaded'
+        upload.save(update_fields=['status', 'updated_at'])
+
+    if upload.status == 'uploaded':
+        with transaction.atomic():
+            # Row lock: two finalize calls must not register the same blob twice
+            upload = ResumableUpload.objects.select_for_update().get(id=upload.id)
+            if upload.status == 'uploaded':
+                error = _register_resumable_upload(upload)
+                if error:
+                    return error
+
+    if not upload.photo:
+        return Response({"error": "Photo for this upload was deleted"}, status=410)
+    data = dict(_photo_entry(upload.photo, _accepted_image_formats(request)), photo_type=upload.photo.photo_type)
+    return Response(data, status=201)
+
+# ----------------------------
+# DELIVERY INFO (STEP 4)
+# ----------------------------
+@api_view(['POST'])
+@parser_classes([BlobStagingMultiPartParser, FormParser])
 def save_delivery_info_api(request):
     load_id = request.data.get("load_id")
     if not load_id:
@@ -474,6 +1051,11 @@ def save_delivery_info_api(request):
     if not load_info:
         return Response({"error": "Load info not found"}, status=404)
 
+    try:
+        _check_upload_budgets(request, {"pod_files": "POD"})
+    except PhotoRejected as e:
+        return Response({"error": str(e)}, status=e.status)
+
     # Update delivery number (allow empty string)
     delivery_number = request.data.get("delivery_number") or request.data.get("deliveryNumber")
     if delivery_number is not None:
@@ -500,20 +1082,15 @@ def save_delivery_info_api(request):
     # Upload new POD files
     uploaded_files = request.FILES.getlist("pod_files")
     for uploaded_file in uploaded_files:
-        DriverLoadPhoto.objects.create(
-            load=load_info,
-            photo_type="POD",
-            image=uploaded_file
-        )
+        _save_load_photo(load_info, "POD", uploaded_file)
 
     # Build response including Step 3 files
-    response_data = _build_file_response(load_info)
+    image_formats = _accepted_image_formats(request)
+    response_data = _build_file_response(load_info, image_formats)
 
     # Add POD files
     pod_photos = DriverLoadPhoto.objects.filter(load=load_info, photo_type="POD")
-    response_data["pod"] = [
-        {"id": photo.id, "url": settings.MEDIA_URL + str(photo.image)} for photo in pod_photos
-    ]
+    response_data["pod"] = [_photo_entry(photo, image_formats) for photo in pod_photos]
 
     # Add delivery info
     response_data["delivery_number"] = load_info.delivery_number or ""
@@ -535,11 +1112,12 @@ def get_delivery_info_api(request, load_id):
         return Response({"error": "Load info not found"}, status=404)
 
     # POD files
+    image_formats = _accepted_image_formats(request)
     pod_photos = DriverLoadPhoto.objects.filter(load=load_info, photo_type="POD")
-    pod_list = [{"id": photo.id, "url": settings.MEDIA_URL + str(photo.image)} for photo in pod_photos]
+    pod_list = [_photo_entry(photo, image_formats) for photo in pod_photos]
 
     # Include Step 3 files as well
-    response_data = _build_file_response(load_info)
+    response_data = _build_file_response(load_info, image_formats)
     response_data["pod"] = pod_list
     response_data["delivery_number"] = load_info.delivery_number or ""
     response_data["delivery_notes"] = load_info.delivery_notes or ""
@@ -1019,12 +1597,18 @@ def get_load_detail_api(request, load_id):
             "pod": []
         }
 
+        image_formats = _accepted_image_formats(request)
         for photo in photos:
             key = photo.photo_type.lower().replace(" ", "_")
             if key in file_map:
+                thumbnail_name = photo.rendition_name("thumb", image_formats)
+                resized_name = photo.rendition_name("preview", image_formats)
                 file_map[key].append({
                     "id": photo.id,
-                    "url": photo.image.url if photo.image else ""
+                    "url": photo.image.storage.url(_photo_url_name(photo)) if photo.image else "",
+                    "thumbnail_url": photo.image.storage.url(thumbnail_name) if thumbnail_name else "",
+                    "resized_url": photo.image.storage.url(resized_name) if resized_name else "",
+                    "derivatives_ready": photo.derivatives_ready,
                 })
 
         # Response data for Flutter